@@ -0,0 +1,119 @@
+"""
+File: async_generator.py
+Description: Generates passwords from asyncio code without blocking the event loop
+"""
+
+from password_generator import PasswordGenerator
+from bulk_generator import generate_chunk, DEFAULT_CHUNK_SIZE
+from concurrent.futures import Executor
+from collections.abc import AsyncIterable, AsyncIterator, Iterable
+from collections import deque
+from functools import partial
+from itertools import islice
+from stats import timed
+import asyncio
+
+MAX_PENDING_CHUNKS = 4
+
+def generate_seeded(
+    service: str, secret: str, iteration: int, min_length: int,
+    upper: bool = True, lower: bool = True, digit: bool = True, special: bool = True,
+    kdf: 'KeyDerivation' = None
+) -> str:
+    """
+    Seeds and generates a password with its own generator, so concurrent calls do not share state.
+    :param kdf: The key derivation to seed from, or None to seed from a hash of the input
+    :return: The generated password
+    """
+
+    if kdf is not None:
+        rng = kdf.seeded(service, secret, iteration)
+    else:
+        rng = PasswordGenerator.seeded(PasswordGenerator.composite_seed(service, secret, iteration))
+    return PasswordGenerator.generate(min_length, upper, lower, digit, special, rng=rng)
+
+class AsyncPasswordGenerator(object):
+    """
+    Generates passwords from coroutines, running the hashing, key derivation and generation in an
+    executor. Every password is drawn from its own seeded generator rather than the global state
+    set by PasswordGenerator.seed(), so concurrent coroutines never disturb each other's seeds.
+    """
+
+    __slots__ = '__executor', '__kdf', '__chunk_size'
+
+    def __init__(
+        self, executor: Executor = None, kdf: 'KeyDerivation' = None, chunk_size: int = DEFAULT_CHUNK_SIZE
+    ) -> None:
+        """
+        Configures the generator.
+        :param executor: Runs the CPU-bound work, defaults to the event loop's default executor;
+            a ProcessPoolExecutor avoids contending for the GIL
+        :param kdf: The key derivation used by generate(kdf=True), defaults to a new KeyDerivation shared by every call
+        :param chunk_size: The number of specs generate_many() sends to the executor at a time
+        """
+
+        if chunk_size <= 0:
+            raise ValueError('Chunk size must be positive')
+        self.__executor = executor
+        self.__kdf = kdf
+        self.__chunk_size = chunk_size
+
+    @timed('generator.generate_async')
+    async def generate(
+        self, service: str, secret: str, iteration: int, min_length: int,
+        upper: bool = True, lower: bool = True, digit: bool = True, special: bool = True, kdf: bool = False
+    ) -> str:
+        """
+        Generates the password for input arguments.
+        :param kdf: Whether to seed the password from the memory-hard key derivation of the secret
+        :return: The generated password
+        """
+
+        if kdf and self.__kdf is None:
+            from kdf import KeyDerivation
+            self.__kdf = KeyDerivation()
+        task = partial(
+            generate_seeded, service, secret, iteration, min_length, upper, lower, digit, special,
+            kdf=self.__kdf if kdf else None
+        )
+        return await asyncio.get_running_loop().run_in_executor(self.__executor, task)
+
+    async def generate_many(self, specs: Iterable[tuple] | AsyncIterable[tuple]) -> AsyncIterator[str]:
+        """
+        Generates a password for each spec a chunk at a time, keeping a bounded number of chunks in flight.
+        :param specs: Specs in the format accepted by PasswordGenerator.generate_many, possibly arriving asynchronously
+        :return: The generated passwords, in the order of the specs
+        """
+
+        loop = asyncio.get_running_loop()
+        pending = deque()
+        try:
+            async for chunk in self.__chunks(specs):
+                if len(pending) >= MAX_PENDING_CHUNKS:
+                    for password in await pending.popleft():
+                        yield password
+                pending.append(loop.run_in_executor(self.__executor, generate_chunk, chunk))
+            while pending:
+                for password in await pending.popleft():
+                    yield password
+        finally:
+            # Chunks still running when iteration stops early are not waited for
+            for future in pending:
+                future.cancel()
+
+    async def __chunks(self, specs: Iterable[tuple] | AsyncIterable[tuple]) -> AsyncIterator[list]:
+        """Splits specs into lists of at most the chunk size."""
+
+        if not isinstance(specs, AsyncIterable):
+            iterator = iter(specs)
+            while chunk := list(islice(iterator, self.__chunk_size)):
+                yield chunk
+            return
+        chunk = []
+        async for spec in specs:
+            chunk.append(spec)
+            if len(chunk) >= self.__chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
@@ -0,0 +1,204 @@
+"""
+File: async_logger.py
+Description: Logs messages from asyncio code through a background writer
+"""
+
+from concurrent.futures import Executor
+from collections.abc import Callable
+from stats import Stats
+import asyncio
+
+DEFAULT_QUEUE_SIZE = 1024
+MAX_BATCH_SIZE = 256
+
+class AsyncLogger(object):
+    """
+    Logs messages from coroutines without blocking the event loop. Messages wait in a bounded queue,
+    so producers slow down to the pace of the disk, and a background writer task applies them to a
+    Logger, SQLiteLogger or SegmentedLogger in an executor, a batch at a time. Calls into the logger
+    are serialized, so it is never used by two threads at once.
+    """
+
+    __slots__ = '__logger', '__executor', '__queue', '__writer', '__lock', '__error'
+
+    def __init__(self, logger: object, max_queue: int = DEFAULT_QUEUE_SIZE, executor: Executor = None) -> None:
+        """
+        Configures the asynchronous logger, whose writer starts with start() or when entering its context.
+        :param logger: The logger to write to, which the asynchronous logger takes ownership of
+        :param max_queue: The number of messages that may wait for the writer before log() blocks
+        :param executor: Runs the blocking logger calls, defaults to the event loop's default executor
+        """
+
+        if max_queue <= 0:
+            raise ValueError('Queue size must be positive')
+        self.__logger = logger
+        self.__executor = executor
+        self.__queue = asyncio.Queue(max_queue)
+        self.__writer = None
+        self.__lock = asyncio.Lock()
+        self.__error = None
+
+    async def start(self) -> None:
+        """Starts the background writer on the running event loop."""
+
+        if self.__writer is None:
+            self.__writer = asyncio.create_task(self.__write())
+
+    async def log(self, message: str) -> None:
+        """
+        Queues a message to be logged, waiting while the queue is full. Errors writing it are raised
+        by the next flush() or close().
+        """
+
+        await self.__put(message, None)
+
+    async def log_if_not_exists(self, message: str) -> bool:
+        """
+        Logs a message only if it does not already exist in the logs, once the writer reaches it.
+        :param message:
+        :return: True if the message was logged, False otherwise
+        """
+
+        future = asyncio.get_running_loop().create_future()
+        await self.__put(message, future)
+        return await future
+
+    async def flush(self) -> None:
+        """Waits for the queued messages to be logged, then writes buffered messages to the log."""
+
+        await self.__queue.join()
+        await self.__call(self.__logger.flush)
+        self.__raise()
+
+    async def refresh(self) -> list:
+        """Picks up the messages other processes logged, as the logger's refresh() does."""
+
+        return await self.__call(self.__logger.refresh)
+
+    async def clear(self) -> None:
+        """Clears all logs once the queued messages have been logged."""
+
+        await self.__queue.join()
+        await self.__call(self.__logger.clear)
+
+    async def get_logs(self) -> list:
+        """Retrieves a copy of the logs once the queued messages have been logged."""
+
+        await self.__queue.join()
+        return await self.__call(self.__logger.get_logs)
+
+    async def close(self) -> None:
+        """Logs the queued messages, stops the writer and closes the logger."""
+
+        if self.__writer is not None:
+            await self.__queue.join()
+            self.__writer.cancel()
+            await asyncio.gather(self.__writer, return_exceptions=True)
+            self.__writer = None
+        await self.__call(self.__logger.close)
+        self.__raise()
+
+    async def __aenter__(self) -> 'AsyncLogger':
+        """Starts the writer when entering the logger's context."""
+
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info: tuple) -> None:
+        """Closes the logger when leaving its context."""
+
+        await self.close()
+
+    def __len__(self) -> int:
+        """Counts the messages waiting for the writer."""
+
+        return self.__queue.qsize()
+
+    async def __put(self, message: str, future: asyncio.Future | None) -> None:
+        """Queues a message and the future awaiting its result, if any."""
+
+        if self.__writer is None:
+            raise RuntimeError('The logger has not been started')
+        if self.__writer.done():
+            raise RuntimeError('The logger\'s writer has stopped')
+        if self.__queue.full():
+            Stats.increment('logger.queue_full')
+        await self.__queue.put((message, future))
+        if self.__writer.done():
+            # The writer stopped while this message waited for room in the queue
+            self.__abandon([])
+
+    async def __call(self, function: Callable, *args: tuple) -> object:
+        """Calls the logger in the executor, after any other call into it has finished."""
+
+        async with self.__lock:
+            return await asyncio.get_running_loop().run_in_executor(self.__executor, function, *args)
+
+    async def __write(self) -> None:
+        """Applies queued messages to the logger a batch at a time, until cancelled."""
+
+        batch = []
+        try:
+            while True:
+                batch = [await self.__queue.get()]
+                while len(batch) < MAX_BATCH_SIZE and not self.__queue.empty():
+                    batch.append(self.__queue.get_nowait())
+                try:
+                    results = await self.__call(self.__apply, batch)
+                except Exception as e:
+                    # The batch never reached the logger, e.g. because the executor was shut down
+                    results = [e] * len(batch)
+                finally:
+                    for _ in batch:
+                        self.__queue.task_done()
+                for (_, future), result in zip(batch, results):
+                    if future is None:
+                        if isinstance(result, Exception):
+                            self.__error = self.__error or result
+                    elif future.done():
+                        # The coroutine awaiting the result was cancelled, though the message was still logged
+                        continue
+                    elif isinstance(result, Exception):
+                        future.set_exception(result)
+                    else:
+                        future.set_result(result)
+        except BaseException:
+            # Fail the unresolved messages rather than leave their producers waiting forever
+            self.__abandon(batch)
+            raise
+
+    def __apply(self, batch: list) -> list:
+        """
+        Logs a batch of messages, in the executor.
+        :param batch: Tuples of (message, future), messages without a future being logged unconditionally
+        :return: The result of each message, or the error that prevented logging it
+        """
+
+        results = []
+        for message, future in batch:
+            try:
+                results.append(self.__logger.log(message) if future is None else self.__logger.log_if_not_exists(message))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def __abandon(self, batch: list) -> None:
+        """
+        Fails the messages of a batch the stopped writer did not log, along with every queued message.
+        :param batch: Tuples of (message, future) already taken off the queue
+        """
+
+        abandoned = batch[:]
+        while not self.__queue.empty():
+            abandoned.append(self.__queue.get_nowait())
+            self.__queue.task_done()
+        for _, future in abandoned:
+            if future is not None and not future.done():
+                future.set_exception(RuntimeError('The logger\'s writer stopped before logging the message'))
+
+    def __raise(self) -> None:
+        """Raises the first error writing a message queued by log(), once."""
+
+        if (error := self.__error) is not None:
+            self.__error = None
+            raise error
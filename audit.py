@@ -0,0 +1,98 @@
+"""
+File: audit.py
+Description: Finds the logged input that generated a password
+"""
+
+from password_generator import PasswordGenerator, generate, MAX_MIN_LENGTH
+from bulk_generator import map_chunks
+from log_format import parse_log_readings
+from collections.abc import Iterable, Iterator
+from functools import partial
+
+AUDIT_CHUNK_SIZE = 256
+CLASSES = (PasswordGenerator.UPPER, PasswordGenerator.LOWER, PasswordGenerator.DIGIT, PasswordGenerator.SPECIAL)
+
+def composition(password: str) -> tuple:
+    """
+    Counts the characters of each type in a password.
+    :param password: The password to count the characters of
+    :return: The number of uppercase letters, lowercase letters, digits, special characters and other characters
+    """
+
+    counts = [sum(map(characters.__contains__, password)) for characters in CLASSES]
+    return *counts, len(password) - sum(counts)
+
+def expected_composition(min_length: int, upper: bool, lower: bool, digit: bool, special: bool) -> tuple:
+    """
+    Determines the composition of every password generated for a minimum length and options, which
+    holds the same number of characters of each included type and nothing else.
+    :return: The composition, in the format returned by composition()
+    """
+
+    options = (upper, lower, digit, special)
+    min_length = MAX_MIN_LENGTH if min_length > MAX_MIN_LENGTH else min_length
+    num_each = PasswordGenerator.length(min_length, *options) // sum(options)
+    return *(num_each if include else 0 for include in options), 0
+
+def audit_specs(messages: Iterable[str], compositions: set, iterations: range = None) -> Iterator[tuple]:
+    """
+    Lazily lists the input worth regenerating, skipping the log entries whose passwords cannot have
+    the composition of any candidate without generating them.
+    :param messages: The logged input, in log order
+    :param compositions: The compositions of the candidate passwords
+    :param iterations: The iterations to try for every logged service, secret, length and options,
+        besides the logged iteration
+    :return: Tuples of (entry number, input arguments), in log order
+    """
+
+    tried = set()
+    for entry, message in enumerate(messages, 1):
+        try:
+            readings = parse_log_readings(message)
+        except ValueError:
+            continue
+        # Every reading of an entry whose service or secret contains a space is tried
+        for service, secret, iteration, min_length, *options in readings:
+            if expected_composition(min_length, *options[:4]) not in compositions:
+                break
+            # The iteration is seeded from its text, so the logged text is tried as well as the range
+            for iteration in (iteration, *map(str, iterations or ())):
+                if (spec := (service, secret, iteration, min_length, *options)) not in tried:
+                    tried.add(spec)
+                    yield entry, spec
+
+def audit_chunk(specs: list, candidates: frozenset) -> list:
+    """
+    Regenerates the passwords of a chunk of input, possibly inside a worker process.
+    :param specs: Tuples of (entry number, input arguments)
+    :param candidates: The passwords to look for
+    :return: Tuples of (entry number, input arguments, password) for the passwords that are candidates
+    """
+
+    return [(entry, args, password) for entry, args in specs if (password := generate(*args)) in candidates]
+
+def audit_logs(
+    messages: Iterable[str], candidates: Iterable[str], iterations: range = None, workers: int = 1, find_all: bool = False
+) -> Iterator[tuple]:
+    """
+    Finds the input that generated candidate passwords.
+    :param messages: The logged input, in log order
+    :param candidates: The passwords to look for
+    :param iterations: The iterations to try for every logged service, besides the logged ones
+    :param workers: The number of worker processes to regenerate passwords in
+    :param find_all: Whether to keep searching once every candidate has been found
+    :return: Tuples of (entry number, input arguments, password) for each match, until every candidate is found
+    """
+
+    candidates = frozenset(candidates)
+    specs = audit_specs(messages, {composition(candidate) for candidate in candidates}, iterations)
+    remaining = set(candidates)
+    matches = map_chunks(partial(audit_chunk, candidates=candidates), specs, workers, AUDIT_CHUNK_SIZE)
+    try:
+        for match in matches:
+            yield match
+            remaining.discard(match[2])
+            if not remaining and not find_all:
+                return
+    finally:
+        matches.close()
@@ -0,0 +1,235 @@
+"""
+File: benchmark.py
+Description: Benchmarks password generation, logging and CLI startup
+"""
+
+from argparse import ArgumentParser, Namespace
+from tempfile import TemporaryDirectory
+from itertools import product
+from collections import deque
+from statistics import median
+from time import perf_counter
+from typing import Callable
+import platform
+import subprocess
+import json
+import sys
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from password_generator import PasswordGenerator, MAX_MIN_LENGTH
+from vectorized_generator import VectorizedGenerator
+from bulk_generator import BulkGenerator
+from logger import Logger
+
+MIN_LENGTHS = (1, 10, 50, 100, MAX_MIN_LENGTH)
+LOG_SIZES = tuple(10 ** exponent for exponent in range(1, 7))
+OPTION_FLAGS = 'ulds'
+BULK_SIZE = 10000
+REPEAT = 5
+TARGET_TIME = 0.2
+DEFAULT_THRESHOLD = 0.10
+
+def measure(function: Callable, setup: Callable = None, repeat: int = REPEAT, number: int = None) -> dict:
+    """
+    Times a function, calibrating the number of calls per round unless given.
+    :param function: The function to time
+    :param setup: Runs before each round, untimed
+    :param repeat: The number of rounds
+    :param number: The number of calls per round
+    :return: The best and median seconds per call, and the number of calls per round
+    """
+
+    if number is None:
+        number = 1
+        while True:
+            setup and setup()
+            start = perf_counter()
+            for _ in range(number):
+                function()
+            if perf_counter() - start >= TARGET_TIME / repeat or number >= 1 << 20:
+                break
+            number *= 2
+    rounds = []
+    for _ in range(repeat):
+        setup and setup()
+        start = perf_counter()
+        for _ in range(number):
+            function()
+        rounds.append((perf_counter() - start) / number)
+    return {'best': min(rounds), 'median': median(rounds), 'number': number}
+
+def options_to_flags(options: tuple) -> str:
+    """Creates the CLI flags of a combination of options."""
+
+    return '-' + ''.join(flag for flag, enabled in zip(OPTION_FLAGS, options) if enabled)
+
+def bench_generator(results: dict, quick: bool) -> None:
+    """Benchmarks seeding and generation across lengths and options."""
+
+    results['seed'] = measure(lambda: PasswordGenerator.seed('service-secret-1'))
+    combinations = [options for options in product((True, False), repeat=4) if any(options)]
+    if quick:
+        combinations = [(True, False, False, False), (True, True, True, True)]
+    for min_length, options in product(MIN_LENGTHS, combinations):
+        PasswordGenerator.seed('service-secret-1')
+        result = measure(lambda: PasswordGenerator.generate(min_length, *options))
+        result['passwords_per_second'] = 1 / result['median']
+        results[f'generate[{min_length},{options_to_flags(options)}]'] = result
+    specs = [(f'service-{i}', 'secret', 1, 12, (True, True, True, True)) for i in range(BULK_SIZE)]
+    for backend in ('python', 'numpy'):
+        if backend == 'numpy' and not VectorizedGenerator.available():
+            continue
+        generator = BulkGenerator(workers=1, backend=backend)
+        result = measure(lambda: deque(generator.generate(specs), maxlen=0), repeat=3, number=1)
+        result['passwords_per_second'] = BULK_SIZE / result['median']
+        results[f'generate_bulk[{backend}]'] = result
+
+def bench_logger(results: dict, max_size: int) -> None:
+    """Benchmarks constructing, appending to and clearing logs of growing sizes."""
+
+    with TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'log')
+        for size in (size for size in LOG_SIZES if size <= max_size):
+            def fill() -> None:
+                """Writes a log of the current size."""
+
+                with open(filename, 'w') as file:
+                    file.writelines(f'service-{i} secret {i} 12 -ulds\n' for i in range(size))
+
+            fill()
+            repeat = 1 if size >= 10 ** 5 else REPEAT
+            for mode, kwargs in (('eager', {}), ('lean', {'lean': True}), ('lazy', {'lazy': True})):
+                results[f'logger.init[{mode},{size}]'] = measure(
+                    lambda: Logger(filename, **kwargs).close(), repeat=repeat, number=1 if repeat == 1 else None
+                )
+                logger = Logger(filename, **kwargs)
+                # The first lookup misses so that every call writes a new entry
+                counter = iter(range(1 << 30))
+                results[f'logger.log_if_not_exists[{mode},{size}]'] = measure(
+                    lambda: logger.log_if_not_exists(f'new-{next(counter)} secret 1 12 -ulds'), repeat=repeat
+                )
+                logger.close()
+                fill()
+            logger = Logger(filename)
+            results[f'logger.clear[{size}]'] = measure(logger.clear, setup=fill, repeat=repeat, number=1)
+            logger.close()
+
+def bench_cli(results: dict) -> None:
+    """Benchmarks the wall-clock and import time of a CLI invocation."""
+
+    with TemporaryDirectory() as directory:
+        command = [sys.executable, os.path.join(ROOT, 'pm_cli.py'), 'service', 'secret', '1', '12', '-ulds']
+        results['cli.wall'] = measure(
+            lambda: subprocess.run(command, cwd=directory, check=True, capture_output=True), number=1
+        )
+        results['cli.import'] = measure(lambda: import_time(command, directory), number=1)
+
+def import_time(command: list, directory: str) -> float:
+    """
+    Runs a command with -X importtime.
+    :return: The cumulative import time in seconds of the modules the command imports
+    """
+
+    process = subprocess.run(
+        [command[0], '-X', 'importtime', *command[1:]], cwd=directory, check=True, capture_output=True, text=True
+    )
+    total = 0
+    for line in process.stderr.splitlines():
+        # Lines look like "import time:  self [us] | cumulative | module", top-level modules are not indented
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module = line.split('|')
+        if not module.startswith('  '):
+            total += int(cumulative)
+    return total / 1e6
+
+def run(args: Namespace) -> None:
+    """Runs the benchmarks and writes their results as JSON."""
+
+    results = {}
+    if 'generator' in args.only:
+        bench_generator(results, args.quick)
+    if 'logger' in args.only:
+        bench_logger(results, 10 ** 3 if args.quick else args.max_log_size)
+    if 'cli' in args.only:
+        bench_cli(results)
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+        },
+        'results': results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output + '\n')
+    else:
+        print(output)
+
+def compare(args: Namespace) -> None:
+    """Compares two benchmark runs, exiting with an error if any benchmark regressed."""
+
+    with open(args.baseline) as file:
+        baseline = json.load(file)['results']
+    with open(args.current) as file:
+        current = json.load(file)['results']
+    regressions = 0
+    for name in sorted(baseline.keys() & current.keys()):
+        before, after = baseline[name]['median'], current[name]['median']
+        change = (after - before) / before if before else 0.0
+        status = 'REGRESSION' if change > args.threshold else 'improved' if change < -args.threshold else 'ok'
+        regressions += status == 'REGRESSION'
+        print(f'{status:<10} {change:+8.1%}  {before:.3e}s -> {after:.3e}s  {name}')
+    for name in sorted(baseline.keys() ^ current.keys()):
+        print(f'{"missing":<10} {"":>8}  {name}')
+    if regressions:
+        sys.exit(f'{regressions} benchmark(s) regressed by more than {args.threshold:.0%}')
+
+def parse_args() -> Namespace:
+    """Parses command line arguments."""
+
+    arg_parser = ArgumentParser(description='benchmark the password manager')
+    subparsers = arg_parser.add_subparsers(dest='command', required=True)
+    run_parser = subparsers.add_parser('run', help='run the benchmarks')
+    run_parser.add_argument('-o', '--output', help='the file to write the JSON results to, stdout by default')
+    run_parser.add_argument('--quick', action='store_true', help='run a reduced set of benchmarks')
+    run_parser.add_argument(
+        '--only',
+        nargs='+',
+        choices=('generator', 'logger', 'cli'),
+        default=('generator', 'logger', 'cli'),
+        help='the groups of benchmarks to run'
+    )
+    run_parser.add_argument(
+        '--max-log-size',
+        type=int,
+        default=LOG_SIZES[-1],
+        help='the largest log size to benchmark'
+    )
+    run_parser.set_defaults(function=run)
+    compare_parser = subparsers.add_parser('compare', help='compare two benchmark runs')
+    compare_parser.add_argument('baseline', help='the JSON results to compare against')
+    compare_parser.add_argument('current', help='the JSON results to check')
+    compare_parser.add_argument(
+        '-t', '--threshold',
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help='the relative slowdown that counts as a regression'
+    )
+    compare_parser.set_defaults(function=compare)
+    return arg_parser.parse_args()
+
+def main() -> None:
+    """Runs the benchmark program."""
+
+    args = parse_args()
+    args.function(args)
+
+if __name__ == '__main__':
+    main()
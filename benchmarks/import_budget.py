@@ -0,0 +1,111 @@
+"""
+File: import_budget.py
+Description: Checks the import time of the CLI and GUI entry points against a budget
+"""
+
+from argparse import ArgumentParser, Namespace
+from tempfile import TemporaryDirectory
+import subprocess
+import sys
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPEAT = 5
+
+# Each check runs a command and limits the cumulative import time in milliseconds of the modules it
+# imports, and names modules the command must not import at all
+CHECKS = {
+    'cli.help': (
+        [os.path.join(ROOT, 'pm_cli.py'), '--help'],
+        45,
+        ('hashlib', 'json', 'csv', 'typing', 'sqlite3', 'concurrent.futures', 'tkinter')
+    ),
+    'cli.generate': (
+        [os.path.join(ROOT, 'pm_cli.py'), 'service', 'secret', '1', '12', '-ulds'],
+        35,
+        ('argparse', 're', 'json', 'csv', 'typing', 'shutil', 'tempfile', 'sqlite3', 'concurrent.futures')
+    ),
+    'gui.import': (
+        ['-c', f'import sys; sys.path.insert(0, {ROOT!r}); import gui'],
+        60,
+        ('pyglet', 'typing', 'sqlite3', 'concurrent.futures')
+    ),
+}
+
+def import_times(command: list, directory: str) -> dict:
+    """
+    Runs a Python command with -X importtime.
+    :param command: The arguments to the interpreter
+    :param directory: The working directory of the command
+    :return: The cumulative import time in microseconds of every module imported, and of all top-level modules under None
+    """
+
+    # Bytecode is cached as it would be after installation, rather than compiled on every run
+    environment = {key: value for key, value in os.environ.items() if key != 'PYTHONDONTWRITEBYTECODE'}
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', *command],
+        cwd=directory, env=environment, check=True, capture_output=True, text=True
+    )
+    times = {None: 0}
+    for line in process.stderr.splitlines():
+        # Lines look like "import time:  self [us] | cumulative | module", top-level modules are not indented
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module = line.split('|')
+        times[module.strip()] = int(cumulative)
+        if not module.startswith('  '):
+            times[None] += int(cumulative)
+    return times
+
+def check(name: str, scale: float, directory: str) -> list:
+    """
+    Runs a check, keeping the fastest of several runs.
+    :param name: The name of the check
+    :param scale: The factor the budget is multiplied by
+    :param directory: The working directory of the command
+    :return: The violations found
+    """
+
+    command, budget, forbidden = CHECKS[name]
+    import_times(command, directory)
+    runs = [import_times(command, directory) for _ in range(REPEAT)]
+    best = min(runs, key=lambda times: times[None])
+    total = best[None] / 1e3
+    print(f'{name:<16}{total:>8.1f}ms  (budget {budget * scale:.1f}ms)')
+    violations = [f'{name} imports {module}' for module in forbidden if module in best]
+    if total > budget * scale:
+        slowest = sorted(((time, module) for module, time in best.items() if module), reverse=True)[:5]
+        details = ', '.join(f'{module} {time / 1e3:.1f}ms' for time, module in slowest)
+        violations.append(f'{name} took {total:.1f}ms to import, over its budget of {budget * scale:.1f}ms ({details})')
+    return violations
+
+def parse_args() -> Namespace:
+    """Parses command line arguments."""
+
+    arg_parser = ArgumentParser(description='check the import time of the entry points against a budget')
+    arg_parser.add_argument(
+        '--only',
+        nargs='+',
+        choices=tuple(CHECKS),
+        default=tuple(CHECKS),
+        help='the checks to run'
+    )
+    arg_parser.add_argument(
+        '--scale',
+        type=float,
+        default=1.0,
+        help='the factor to multiply every budget by, for slower machines'
+    )
+    return arg_parser.parse_args()
+
+def main() -> None:
+    """Runs the import budget checks, exiting with an error if any is violated."""
+
+    args = parse_args()
+    with TemporaryDirectory() as directory:
+        violations = [violation for name in args.only for violation in check(name, args.scale, directory)]
+    if violations:
+        sys.exit('\n'.join(violations))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+File: bulk_generator.py
+Description: Generates large batches of passwords across multiple processes
+"""
+
+from password_generator import PasswordGenerator
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from itertools import islice
+from collections.abc import Callable, Iterable, Iterator
+from functools import partial
+from os import cpu_count
+
+DEFAULT_CHUNK_SIZE = 1000
+BACKENDS = ('python', 'numpy')
+
+def generate_chunk(specs: list, backend: str = 'python') -> list:
+    """
+    Generates the passwords for a chunk of specs inside a worker process.
+    :param specs: The specs to generate passwords for
+    :param backend: 'python' for the passwords of PasswordGenerator, 'numpy' for those of VectorizedGenerator
+    :return: The generated passwords, in the order of the specs
+    """
+
+    if backend == 'numpy':
+        from vectorized_generator import VectorizedGenerator
+        return list(VectorizedGenerator.generate_many(specs))
+    return list(PasswordGenerator.generate_many(specs))
+
+class BulkGenerator(object):
+    """Generates passwords for large spec lists using a process pool."""
+
+    __slots__ = '__workers', '__chunk_size', '__backend'
+
+    def __init__(self, workers: int = None, chunk_size: int = DEFAULT_CHUNK_SIZE, backend: str = 'python') -> None:
+        """
+        Configures the bulk generator.
+        :param workers: The number of worker processes, defaults to the number of CPUs
+        :param chunk_size: The number of specs sent to a worker at a time
+        :param backend: 'python' to generate the same passwords as the CLI and GUI, or 'numpy' to generate
+            those of the separate, versioned scheme of VectorizedGenerator, which is faster but requires NumPy
+        """
+
+        if chunk_size <= 0:
+            raise ValueError('Chunk size must be positive')
+        if backend not in BACKENDS:
+            raise ValueError(f'Unknown backend: {backend}')
+        if backend == 'numpy':
+            from vectorized_generator import VectorizedGenerator
+            if not VectorizedGenerator.available():
+                raise ImportError('The numpy backend requires NumPy')
+        self.__backend = backend
+        self.__workers = workers or cpu_count() or 1
+        self.__chunk_size = chunk_size
+
+    def generate(self, specs: Iterable[tuple]) -> Iterator[str]:
+        """
+        Generates a password for each spec, preserving the input order.
+        :param specs: Specs in the format accepted by PasswordGenerator.generate_many
+        :return: The generated passwords, in the order of the specs
+        """
+
+        return map_chunks(partial(generate_chunk, backend=self.__backend), specs, self.__workers, self.__chunk_size)
+
+def map_chunks(
+    function: Callable[[list], list], items: Iterable, workers: int = 1, chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> Iterator:
+    """
+    Applies a function to chunks of items, in worker processes if there is more than one worker.
+    :param function: Maps a list of items to a list of results, and must be picklable to run in workers
+    :param items: The items to map
+    :param workers: The number of worker processes
+    :param chunk_size: The number of items sent to a worker at a time
+    :return: The results, in the order of the items
+    """
+
+    iterator = iter(items)
+    chunks = iter(lambda: list(islice(iterator, chunk_size)), [])
+    if workers == 1:
+        for chunk in chunks:
+            yield from function(chunk)
+        return
+    with ProcessPoolExecutor(workers) as executor:
+        pending = deque()
+        try:
+            for chunk in chunks:
+                # Keep a bounded number of chunks in flight so large inputs are not held in memory
+                if len(pending) >= 2 * workers:
+                    yield from pending.popleft().result()
+                pending.append(executor.submit(function, chunk))
+            while pending:
+                yield from pending.popleft().result()
+        finally:
+            # When the caller stops early, only chunks already running are waited for
+            for future in pending:
+                future.cancel()
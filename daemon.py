@@ -0,0 +1,155 @@
+"""
+File: daemon.py
+Description: Serves password manager requests over a local Unix domain socket
+"""
+
+from typing import Callable
+from socket import socket, AF_UNIX, SOCK_STREAM, SOL_SOCKET
+from struct import calcsize, unpack
+from signal import SIGTERM
+import asyncio
+import json
+import os
+import stat
+
+try:
+    from socket import SO_PEERCRED
+except ImportError:
+    SO_PEERCRED = None
+
+MAX_REQUEST_SIZE = 64 * 1024
+CLIENT_TIMEOUT = 10.0
+
+def default_socket_path() -> str:
+    """Determines the per-user socket path of the daemon."""
+
+    runtime_directory = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_directory:
+        return os.path.join(runtime_directory, 'password-manager.sock')
+    # Any user can create files in /tmp, so the socket lives in a directory only the current user can enter
+    return os.path.join('/tmp', f'password-manager-{os.getuid()}', 'password-manager.sock')
+
+def prepare_socket_directory(directory: str) -> None:
+    """
+    Creates the directory of a socket, private to the current user, if it does not exist yet.
+    :param directory: The directory to hold the socket
+    :raises PermissionError: If another user owns the directory or may replace the socket in it
+    """
+
+    try:
+        os.mkdir(directory, 0o700)
+    except FileExistsError:
+        pass
+    status = os.stat(directory)
+    # Shared directories such as /tmp are owned by root and only let the owner of a file remove it
+    if status.st_uid not in (0, os.getuid()) or (
+        status.st_mode & (stat.S_IWGRP | stat.S_IWOTH) and not status.st_mode & stat.S_ISVTX
+    ):
+        raise PermissionError(f'{directory} is not safe to hold the socket, as another user controls it')
+
+def is_same_user(connection: socket) -> bool:
+    """Checks that the peer of a connection runs as the current user, where the platform reports it."""
+
+    if SO_PEERCRED is None:
+        return True
+    credentials = connection.getsockopt(SOL_SOCKET, SO_PEERCRED, calcsize('3i'))
+    _, uid, _ = unpack('3i', credentials)
+    return uid == os.getuid()
+
+class Daemon(object):
+    """Answers requests from local clients over a Unix domain socket."""
+
+    __slots__ = '__path', '__handler'
+
+    def __init__(self, path: str, handler: Callable[[dict], dict]) -> None:
+        """
+        Configures the daemon.
+        :param path: The path of the Unix domain socket to listen on
+        :param handler: Produces the response to a request, raising ValueError or TypeError for invalid requests.
+            It is called from a thread pool, so requests of several clients are handled concurrently
+        """
+
+        self.__path = path
+        self.__handler = handler
+
+    def run(self) -> None:
+        """Serves requests until interrupted."""
+
+        try:
+            asyncio.run(self.__serve())
+        except (KeyboardInterrupt, asyncio.CancelledError):
+            pass
+
+    async def __serve(self) -> None:
+        """Listens on the socket, restricted to the current user."""
+
+        prepare_socket_directory(os.path.dirname(os.path.abspath(self.__path)))
+        self.__remove_stale_socket()
+        # Create the socket without group or other permissions from the start
+        umask = os.umask(0o177)
+        try:
+            server = await asyncio.start_unix_server(self.__handle, self.__path, limit=MAX_REQUEST_SIZE)
+        finally:
+            os.umask(umask)
+        os.chmod(self.__path, stat.S_IRUSR | stat.S_IWUSR)
+        asyncio.get_running_loop().add_signal_handler(SIGTERM, asyncio.current_task().cancel)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            os.remove(self.__path)
+
+    async def __handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Answers each newline-delimited JSON request sent by a client."""
+
+        loop = asyncio.get_running_loop()
+        try:
+            if not is_same_user(writer.get_extra_info('socket')):
+                return
+            while line := await asyncio.wait_for(reader.readline(), CLIENT_TIMEOUT):
+                try:
+                    # Generating takes long enough to stall every other client if run on the event loop
+                    response = await loop.run_in_executor(None, self.__handler, json.loads(line))
+                except (ValueError, TypeError) as e:
+                    response = {'error': str(e)}
+                writer.write(json.dumps(response).encode('UTF-8') + b'\n')
+                await writer.drain()
+        except (asyncio.TimeoutError, asyncio.LimitOverrunError, ValueError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def __remove_stale_socket(self) -> None:
+        """Removes a socket left behind by a daemon that is no longer running."""
+
+        if not os.path.exists(self.__path):
+            return
+        if not stat.S_ISSOCK(os.stat(self.__path).st_mode):
+            raise FileExistsError(f'{self.__path} exists and is not a socket')
+        with socket(AF_UNIX, SOCK_STREAM) as probe:
+            try:
+                probe.connect(self.__path)
+            except ConnectionRefusedError:
+                os.remove(self.__path)
+            else:
+                raise FileExistsError(f'A daemon is already listening on {self.__path}')
+
+def request(path: str, message: dict) -> dict:
+    """
+    Sends a request to a running daemon.
+    :param path: The path of the daemon's Unix domain socket
+    :param message: The request
+    :return: The daemon's response
+    :raises PermissionError: If the socket or the daemon belongs to another user, which would receive the secret
+    """
+
+    if os.stat(path).st_uid != os.getuid():
+        raise PermissionError(f'{path} is owned by another user')
+    with socket(AF_UNIX, SOCK_STREAM) as connection:
+        connection.connect(path)
+        # The socket may have been replaced since it was checked, so the daemon itself is checked as well
+        if not is_same_user(connection):
+            raise PermissionError(f'The daemon listening on {path} runs as another user')
+        connection.sendall(json.dumps(message).encode('UTF-8') + b'\n')
+        with connection.makefile('rb') as response:
+            return json.loads(response.readline())
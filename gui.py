@@ -5,12 +5,18 @@ Author: Justin Thoreson
 Date: January 2024
 """
 
-from password_generator import PasswordGenerator
-from logger import Logger
-from typing import Any, Callable
-from pyglet import font
+from password_generator import PasswordGenerator, MAX_MIN_LENGTH, args_to_string
+from logger import open_logger
+from log_index import LogIndex
+from stats import timed
+from collections.abc import Callable
+from functools import lru_cache
 from sys import maxsize
+from itertools import islice
+from threading import Lock
+from queue import Queue
 import tkinter as tk
+import tkinter.font as tkfont
 
 TITLE = 'Password Manager'
 WIDTH = 500
@@ -25,15 +31,38 @@ TEXT_FONT_SIZE = 10
 PADDING = 10
 ICON_FILEPATH = 'assets/images/pm.ico'
 LOG_FILENAME = 'log'
-MAX_MIN_LENGTH = 250
+DATABASE_LOG_FILENAME = 'log.db'
+SEGMENTED_LOG_DIRECTORY = 'log.d'
+LOG_LOAD_CHUNK = 5000
+LOG_LOAD_INTERVAL = 1
+LOG_POLL_INTERVAL = 500
+RESULT_POLL_INTERVAL = 10
+PREVIEW_DELAY = 300
+FILTER_DELAY = 150
+
+@lru_cache(maxsize=None)
+def register_font(filename: str) -> None:
+    """
+    Makes a font file available to Tk, once per process.
+    :param filename: The TrueType font file
+    """
+
+    # pyglet is only needed here, so it is imported on first use rather than with the module
+    from pyglet import font
+    font.add_file(filename)
 
 class GUI(object):
     """Represents all graphical user interface functionality."""
 
-    def __init__(self) -> None:
-        """Configures the GUI."""
+    @timed('gui.startup')
+    def __init__(self, log_backend: str = 'text') -> None:
+        """
+        Configures the GUI.
+        :param log_backend: How the log is stored, either 'text', 'sqlite' or 'segmented'
+        """
 
-        font.add_file(f'assets/fonts/{PRIMARY_FONT}.ttf')
+        register_font(f'assets/fonts/{PRIMARY_FONT}.ttf')
+        self.__log_backend = log_backend
         self.__init_window()
         self.__init_window_content()
     
@@ -46,8 +75,8 @@ class GUI(object):
         """Sets the window content."""
 
         Heading(self.__window, TITLE, width=WIDTH, height=75, bg=PRIMARY_COLOR, fg=SECONDARY_COLOR, font=(PRIMARY_FONT, HEADING_FONT_SIZE))
-        log = Log(self.__window, width=WIDTH / 2, height=325, bg=PRIMARY_COLOR, fg=SECONDARY_COLOR, padx=PADDING, pady=PADDING)
-        Generator(self.__window, log.add, width=WIDTH / 2, height=325, bg=PRIMARY_COLOR, fg=SECONDARY_COLOR, padx=PADDING, pady=PADDING)
+        log = Log(self.__window, self.__log_backend, width=WIDTH / 2, height=325, bg=PRIMARY_COLOR, fg=SECONDARY_COLOR, padx=PADDING, pady=PADDING)
+        Generator(self.__window, log.record, log.show, width=WIDTH / 2, height=325, bg=PRIMARY_COLOR, fg=SECONDARY_COLOR, padx=PADDING, pady=PADDING)
 
     def render(self) -> None:
         """Runs the GUI."""
@@ -94,7 +123,7 @@ class Window(tk.Tk):
 class Heading(tk.Frame):
     """Represents a heading."""
 
-    def __init__(self, parent: Any, text: str, fg: str = ..., font: tuple = ..., *args: tuple, **kwargs: dict) -> None:
+    def __init__(self, parent: tk.Misc, text: str, fg: str = ..., font: tuple = ..., *args: tuple, **kwargs: dict) -> None:
         """
         Configures the heading.
         :param parent: The parent widget containing the heading
@@ -122,19 +151,28 @@ class Heading(tk.Frame):
         tk.Label(self, text=text, bg=kwargs['bg'], fg=fg, font=font).pack(anchor=tk.CENTER, padx=PADDING, pady=(PADDING, 0))
 
 class Log(tk.Frame):
-    """Represents an input log."""
+    """Represents an input log, following the entries other processes add to it."""
 
-    def __init__(self, parent: Any, fg: str = ..., *args: tuple, **kwargs: dict) -> None:
+    def __init__(self, parent: tk.Misc, backend: str = 'text', fg: str = ..., *args: tuple, **kwargs: dict) -> None:
         """
         Configures the log.
         :param parent: The parent widget containing the log
+        :param backend: How the log is stored, either 'text', 'sqlite' or 'segmented'
         :param fg: The foreground color of the log
         :param args: Additional arguments
         :param kwargs: Additional keyword arguments
         """
 
         super().__init__(parent, *args, **kwargs)
-        self.logger = Logger(LOG_FILENAME)
+        filename = {'sqlite': DATABASE_LOG_FILENAME, 'segmented': SEGMENTED_LOG_DIRECTORY}.get(backend, LOG_FILENAME)
+        # The file is read as the list loads, which also indexes it so duplicate checks need not scan it
+        self.logger = open_logger(filename, backend, lean=True, lazy=True)
+        self.__logger_lock = Lock()
+        self.__index = LogIndex()
+        self.__changes = Queue()
+        self.logger.subscribe(self.__index)
+        # Changes may be made on the generator's worker thread, so they are shown from a queue
+        self.logger.subscribe(self)
         self.grid(row=1, column=0)
         self.pack_propagate(False)
         self.__init_log_content(fg=fg, **kwargs)
@@ -151,38 +189,234 @@ class Log(tk.Frame):
         # List box
         list_frame = tk.Frame(log_frame, bg=bg)
         tk.Label(list_frame, text='Log', bg=bg, fg=fg, font=(SECONDARY_FONT, SUBHEADING_FONT_SIZE)).pack(side=tk.TOP)
-        list_scrollbar = tk.Scrollbar(list_frame, orient=tk.VERTICAL)
-        self.log_list = tk.Listbox(list_frame, yscrollcommand=list_scrollbar.set, font=(SECONDARY_FONT, TEXT_FONT_SIZE))
-        list_scrollbar.config(command=self.log_list.yview)
-        list_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        # Filter box
+        self.filter = tk.Entry(list_frame, bg='white')
+        self.filter.pack(side=tk.TOP, fill=tk.X)
+        self.filter.bind('<KeyRelease>', self.__filter_changed)
+        self.__filter_job = None
+        self.log_list = VirtualList(list_frame, bg=bg, font=(SECONDARY_FONT, TEXT_FONT_SIZE))
         self.log_list.pack(expand=True, fill=tk.BOTH)
-        for log in self.logger.get_logs():
-            self.log_list.insert(tk.END, log)
         list_frame.pack(expand=True, fill=tk.BOTH)
         # Clear list button
         tk.Button(log_frame, text='Clear', command=self.__clear, bg=fg).pack(pady=(PADDING, 0))
         log_frame.pack(expand=True, fill=tk.BOTH)
+        # Show the first entries right away and load the rest in the background
+        self.__loaded = 0
+        self.__loading = iter(self.logger)
+        self.__load_job = None
+        self.__load()
+        self.after(LOG_POLL_INTERVAL, self.__poll)
 
     def add(self, message: str) -> None:
         """Adds a message to the log."""
         
-        if self.logger.log_if_not_exists(message):
-            self.log_list.insert(tk.END, message)
+        if self.record(message):
+            self.show()
+
+    def record(self, message: str) -> bool:
+        """
+        Logs a message to the file if it is new, safely from any thread.
+        :param message: The message to log
+        :return: True if the message was logged, False otherwise
+        """
+
+        with self.__logger_lock:
+            return self.logger.log_if_not_exists(message)
+
+    def show(self) -> None:
+        """Shows the changes made to the log since they were last shown, such as newly logged messages."""
+
+        if self.__changes.empty():
+            return
+        while not self.__changes.empty():
+            message = self.__changes.get_nowait()
+            if message is not None:
+                self.log_list.append(message)
+                continue
+            if self.__load_job is not None:
+                self.after_cancel(self.__load_job)
+            self.__loading = self.__load_job = None
+            self.__loaded = 0
+            self.log_list.clear()
+        self.__apply_filter()
+
+    def logged(self, message: str) -> None:
+        """Queues a logged message to be shown, safely from any thread."""
+
+        self.__changes.put(message)
+
+    def cleared(self) -> None:
+        """Queues clearing the list, safely from any thread."""
+
+        self.__changes.put(None)
+
+    def __poll(self) -> None:
+        """Shows the entries other processes added to the log, checking again periodically."""
+
+        with self.__logger_lock:
+            self.logger.refresh()
+        self.show()
+        self.after(LOG_POLL_INTERVAL, self.__poll)
+
+    def __filter_changed(self, event: tk.Event) -> None:
+        """Filters the list once the filter has stopped changing."""
+
+        if self.__filter_job is not None:
+            self.after_cancel(self.__filter_job)
+        self.__filter_job = self.after(FILTER_DELAY, self.__apply_filter)
+
+    @timed('gui.filter')
+    def __apply_filter(self) -> None:
+        """Narrows the list to the entries whose service matches the filter."""
+
+        self.__filter_job = None
+        query = self.filter.get()
+        self.log_list.filter(self.__index.find(query) if query else None)
+
+    @timed('gui.load')
+    def __load(self) -> None:
+        """Loads the next chunk of logged entries, scheduling the chunk after it."""
+
+        with self.__logger_lock:
+            chunk = list(islice(self.__loading, LOG_LOAD_CHUNK))
+        # Entries added while loading stay after the entries read from the file
+        self.log_list.insert(self.__loaded, chunk)
+        self.__index.extend(chunk)
+        self.__loaded += len(chunk)
+        self.__apply_filter()
+        if len(chunk) == LOG_LOAD_CHUNK:
+            self.__load_job = self.after(LOG_LOAD_INTERVAL, self.__load)
+        else:
+            self.__loading = self.__load_job = None
 
     def __clear(self) -> None:
         """Clears the log."""
 
-        self.log_list.delete(0, tk.END)
-        self.logger.clear()
+        with self.__logger_lock:
+            self.logger.clear()
+        self.show()
+
+class VirtualList(tk.Frame):
+    """Represents a scrollable list that only materializes its visible rows."""
+
+    def __init__(self, parent: tk.Misc, font: tuple = ..., *args: tuple, **kwargs: dict) -> None:
+        """
+        Configures the list.
+        :param parent: The parent widget containing the list
+        :param font: The font of the rows
+        :param args: Additional arguments
+        :param kwargs: Additional keyword arguments
+        """
+
+        super().__init__(parent, *args, **kwargs)
+        self.__rows = []
+        self.__view = None
+        self.__top = 0
+        self.__visible = 1
+        self.__line_height = tkfont.Font(font=font).metrics('linespace')
+        self.__scrollbar = tk.Scrollbar(self, orient=tk.VERTICAL, command=self.__on_scroll)
+        self.__scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.__listbox = tk.Listbox(self, font=font, activestyle=tk.NONE)
+        self.__listbox.pack(expand=True, fill=tk.BOTH)
+        self.__listbox.bind('<Configure>', self.__on_resize)
+        self.__listbox.bind('<MouseWheel>', lambda event: self.__scroll_by(-event.delta // 120 or -event.delta))
+        self.__listbox.bind('<Button-4>', lambda event: self.__scroll_by(-1))
+        self.__listbox.bind('<Button-5>', lambda event: self.__scroll_by(1))
+
+    def __len__(self) -> int:
+        """Counts the rows."""
+
+        return len(self.__rows)
+
+    def append(self, row: str) -> None:
+        """Adds a row to the end of the list."""
+
+        self.__rows.append(row)
+        self.__render()
+
+    def insert(self, index: int, rows: list) -> None:
+        """
+        Inserts rows into the list.
+        :param index: The position of the first inserted row
+        :param rows: The rows to insert
+        """
+
+        self.__rows[index:index] = rows
+        self.__render()
+
+    def clear(self) -> None:
+        """Removes all rows."""
+
+        self.__rows = []
+        self.__top = 0
+        self.__render()
+
+    def filter(self, rows: list | None) -> None:
+        """
+        Shows a subset of the rows instead of all of them.
+        :param rows: The rows to show, or None to show all rows
+        """
+
+        if rows is None and self.__view is None:
+            return
+        if (rows is None) != (self.__view is None):
+            self.__top = 0
+        self.__view = rows
+        self.__render()
+
+    def __on_resize(self, event: tk.Event) -> None:
+        """Recalculates how many rows fit in the list."""
+
+        border = int(self.__listbox.cget('borderwidth')) + int(self.__listbox.cget('highlightthickness'))
+        self.__visible = max(1, (event.height - 2 * border) // self.__line_height)
+        self.__render()
+
+    def __on_scroll(self, action: str, amount: str, unit: str = None) -> None:
+        """Handles the commands of the scrollbar."""
+
+        if action == tk.MOVETO:
+            self.__scroll_to(round(float(amount) * len(self.__shown())))
+        elif action == tk.SCROLL:
+            self.__scroll_by(int(amount) * (self.__visible if unit == tk.PAGES else 1))
+
+    def __scroll_by(self, rows: int) -> None:
+        """Scrolls the list by a number of rows."""
+
+        self.__scroll_to(self.__top + rows)
+
+    def __scroll_to(self, top: int) -> None:
+        """Scrolls the list so a row is at the top."""
+
+        self.__top = top
+        self.__render()
+
+    def __shown(self) -> list:
+        """Retrieves the rows currently shown, filtered or not."""
+
+        return self.__rows if self.__view is None else self.__view
+
+    def __render(self) -> None:
+        """Shows the rows in view and updates the scrollbar."""
+
+        rows = self.__shown()
+        total = len(rows)
+        self.__top = max(0, min(self.__top, total - self.__visible))
+        self.__listbox.delete(0, tk.END)
+        self.__listbox.insert(tk.END, *rows[self.__top:self.__top + self.__visible])
+        if total:
+            self.__scrollbar.set(self.__top / total, min(1.0, (self.__top + self.__visible) / total))
+        else:
+            self.__scrollbar.set(0.0, 1.0)
 
 class Generator(tk.Frame):
     """Represents a password generator"""
 
-    def __init__(self, parent: Any, log_callback: Callable, fg: str = ..., *args: tuple, **kwargs: dict) -> None:
+    def __init__(self, parent: tk.Misc, log_callback: Callable, show_callback: Callable, fg: str = ..., *args: tuple, **kwargs: dict) -> None:
         """
         Configures the generator.
         :param parent: The parent widget containing the generator
-        :param log_callback: The function used to log input
+        :param log_callback: The function used to log input from the worker thread, returning whether the input is new
+        :param show_callback: The function used to show the log once input has been logged
         :param fg: The foreground color of the generator
         :param args: Additional arguments
         :param kwargs: Additional keyword arguments
@@ -192,7 +426,17 @@ class Generator(tk.Frame):
         self.grid(row=1, column=1)
         self.pack_propagate(False)
         self.__log = log_callback
+        self.__show = show_callback
+        # The worker thread is started by the first request, keeping concurrent.futures out of startup
+        self.__executor = None
+        self.__results = Queue()
+        self.__request_id = 0
+        self.__pending = None
+        self.__pending_log = False
+        self.__poll_job = None
+        self.__preview_job = None
         self.__init_generator_content(fg=fg, **kwargs)
+        self.bind('<Destroy>', self.__destroyed)
 
     def __init_generator_content(self, fg: str = ..., **kwargs: dict) -> None:
         """
@@ -219,10 +463,12 @@ class Generator(tk.Frame):
         self.service.pack(anchor=tk.W)
         self.secret = tk.Entry(entry_frame, width=15, bg='white')
         self.secret.pack(anchor=tk.W)
-        self.iteration = tk.Spinbox(entry_frame, from_=1, to=maxsize, width=TEXT_FONT_SIZE, bg='white')
+        self.iteration = tk.Spinbox(entry_frame, from_=1, to=maxsize, width=TEXT_FONT_SIZE, bg='white', command=self.__changed)
         self.iteration.pack(anchor=tk.W)
-        self.min_length = tk.Spinbox(entry_frame, from_=1, to=MAX_MIN_LENGTH, width=TEXT_FONT_SIZE, bg='white')
+        self.min_length = tk.Spinbox(entry_frame, from_=1, to=MAX_MIN_LENGTH, width=TEXT_FONT_SIZE, bg='white', command=self.__changed)
         self.min_length.pack(anchor=tk.W)
+        for entry in (self.service, self.secret, self.iteration, self.min_length):
+            entry.bind('<KeyRelease>', self.__changed)
         entry_frame.pack(side=tk.RIGHT)
         input_frame.pack(side=tk.TOP)
         # Options
@@ -239,6 +485,12 @@ class Generator(tk.Frame):
         self.digit_checkbox.grid(row=1, column=0, sticky=tk.W)
         self.special_checkbox = tk.Checkbutton(options_frame, text='specials', variable=self.special, bg=bg, fg=fg, font=(SECONDARY_FONT, TEXT_FONT_SIZE))
         self.special_checkbox.grid(row=1, column=1, sticky=tk.W)
+        for option in (self.upper, self.lower, self.digit, self.special):
+            option.trace_add('write', self.__changed)
+        self.preview = tk.BooleanVar()
+        self.preview_checkbox = tk.Checkbutton(options_frame, text='live preview', variable=self.preview, bg=bg, fg=fg, font=(SECONDARY_FONT, TEXT_FONT_SIZE))
+        self.preview_checkbox.grid(row=2, column=0, columnspan=2, sticky=tk.W)
+        self.preview.trace_add('write', self.__changed)
         options_frame.pack(anchor=tk.S)
         # Show password
         tk.Button(generate_frame, text='Show password', command=self.__show_password, bg=fg).pack(pady=PADDING)
@@ -253,54 +505,95 @@ class Generator(tk.Frame):
         generate_frame.pack(expand=True, fill=tk.BOTH)
 
     def __show_password(self) -> None:
-        """Shows the password generated by the given input arguments."""
-
-        if input := self.__generate():
-            self.__log(input)
-
-    def __generate(self) -> str:
-        """Generates a password and returns the input as a string."""
-
-        def args_to_string(
-            service: str, secret: str, iteration: int, min_length: int,
-            upper: bool, lower: bool, digit: bool, special: bool
-        ) -> str:
-            """Creates a string from the input arguments"""
-
-            options = options_to_string(upper, lower, digit, special)
-            return ' '.join(
-                [service, secret, str(iteration), str(min_length), options]
-            )
-
-        def options_to_string(
-            upper: bool, lower: bool, digit: bool, special: bool
-        ) -> str:
-            """Creates a string from the input options."""
-
-            return ''.join(['-',
-                ('u' if upper else ''),
-                ('l' if lower else ''),
-                ('d' if digit else ''),
-                ('s' if special else '')])
-
-        service = self.service.get()
-        secret = self.secret.get()
-        iteration = self.iteration.get()
-        seed = ''.join([service, secret, str(iteration)])
-        PasswordGenerator.seed(seed)
-        min_length = MAX_MIN_LENGTH if (length := int(self.min_length.get())) > MAX_MIN_LENGTH else length
-        upper = self.upper.get()
-        lower = self.lower.get()
-        digit = self.digit.get()
-        special = self.special.get()
+        """Shows the password generated by the given input arguments, logging the input."""
+
+        self.__submit(log=True)
+
+    def __changed(self, *args: tuple) -> None:
+        """Schedules a preview once the input has stopped changing."""
+
+        if self.__preview_job is not None:
+            self.after_cancel(self.__preview_job)
+            self.__preview_job = None
+        if self.preview.get():
+            self.__preview_job = self.after(PREVIEW_DELAY, self.__preview)
+
+    def __preview(self) -> None:
+        """Shows the password generated by the given input arguments without logging the input."""
+
+        self.__preview_job = None
+        self.__submit(log=False)
+
+    def __submit(self, log: bool) -> None:
+        """
+        Generates a password on the worker thread, superseding any earlier request.
+        :param log: Whether to log the input once the password is generated
+        """
+
+        self.__request_id += 1
+        if self.__pending is not None and not self.__pending_log:
+            # Previews are disposable, but logging requests must still run
+            self.__pending.cancel()
         try:
-            password = PasswordGenerator.generate(min_length, upper, lower, digit, special)
-        except ValueError as e:
-            password = e
-            input = None
+            min_length = int(self.min_length.get())
+        except ValueError:
+            self.__display('Minimum length must be an integer')
+            return
+        input = (
+            self.service.get(), self.secret.get(), self.iteration.get(),
+            MAX_MIN_LENGTH if min_length > MAX_MIN_LENGTH else min_length,
+            self.upper.get(), self.lower.get(), self.digit.get(), self.special.get()
+        )
+        if self.__executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self.__executor = ThreadPoolExecutor(max_workers=1)
+        self.__pending = self.__executor.submit(self.__generate, self.__request_id, input, log)
+        self.__pending_log = log
+        if self.__poll_job is None:
+            self.__poll_job = self.after(RESULT_POLL_INTERVAL, self.__poll)
+
+    def __poll(self) -> None:
+        """Displays the results of the worker thread, discarding stale ones."""
+
+        while not self.__results.empty():
+            request_id, password, logged = self.__results.get_nowait()
+            if logged:
+                self.__show()
+            if request_id == self.__request_id:
+                self.__display(password)
+        if self.__pending is not None and not self.__pending.done() or not self.__results.empty():
+            self.__poll_job = self.after(RESULT_POLL_INTERVAL, self.__poll)
         else:
-            input = args_to_string(service, secret, iteration, min_length, upper, lower, digit, special)
-        finally:
-            self.password_text.delete(1.0, tk.END)
-            self.password_text.insert(tk.END, password)
-        return input
+            self.__poll_job = None
+
+    def __destroyed(self, event: tk.Event) -> None:
+        """Stops the worker thread once the generator is destroyed."""
+
+        if event.widget is self and self.__executor is not None:
+            self.__executor.shutdown(wait=False, cancel_futures=True)
+
+    def __display(self, text: str) -> None:
+        """Replaces the displayed password."""
+
+        self.password_text.delete(1.0, tk.END)
+        self.password_text.insert(tk.END, text)
+
+    @timed('gui.generate')
+    def __generate(self, request_id: int, input: tuple, log: bool) -> None:
+        """
+        Generates a password on the worker thread, queueing the result for the main thread.
+        :param request_id: The request the password is generated for
+        :param input: The service, secret, iteration, minimum length and options
+        :param log: Whether to log the input
+        """
+
+        service, secret, iteration, min_length, upper, lower, digit, special = input
+        # Each request gets its own generator so overlapping requests cannot disturb each other
+        rng = PasswordGenerator.seeded(PasswordGenerator.composite_seed(service, secret, iteration))
+        try:
+            password = PasswordGenerator.generate(min_length, upper, lower, digit, special, rng=rng)
+        except ValueError as e:
+            self.__results.put((request_id, str(e), False))
+            return
+        logged = log and self.__log(args_to_string(*input))
+        self.__results.put((request_id, password, logged))
@@ -0,0 +1,148 @@
+"""
+File: kdf.py
+Description: Derives password seeds from a memory-hard master key
+"""
+
+from hashlib import scrypt, pbkdf2_hmac, blake2b, sha256
+from collections import OrderedDict
+from threading import Lock
+from random import Random
+from time import monotonic
+from typing import Callable, TypeVar
+from os import urandom
+import hmac
+
+# Passwords must be reproducible, so the salt is fixed rather than random
+SALT = b'password-manager/kdf/v1'
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+PBKDF2_ITERATIONS = 600_000
+KEY_LENGTH = 32
+CACHE_SIZE = 16
+CACHE_TTL = 300.0
+
+T = TypeVar('T')
+
+class MasterKeyCache(object):
+    """Holds derived master keys in a bounded LRU cache, zeroizing them on eviction."""
+
+    __slots__ = '__entries', '__max_size', '__ttl', '__lock', '__tag_key'
+
+    def __init__(self, max_size: int = CACHE_SIZE, ttl: float = CACHE_TTL) -> None:
+        """
+        Configures the cache.
+        :param max_size: The maximum number of master keys held at once
+        :param ttl: The number of seconds a master key is held after it is derived
+        """
+
+        self.__entries = OrderedDict()
+        self.__max_size = max_size
+        self.__ttl = ttl
+        self.__lock = Lock()
+        # Secrets are looked up by a tag keyed per process so they are never stored themselves
+        self.__tag_key = urandom(blake2b.MAX_KEY_SIZE)
+
+    def use(self, secret: str, derive: Callable[[str], bytearray], action: Callable[[bytearray], T]) -> T:
+        """
+        Acts on the master key of a secret, deriving and caching the key on a miss.
+        :param secret: The master secret
+        :param derive: Derives the master key of a secret
+        :param action: Uses the master key, which must not be kept since it is zeroized once evicted
+        :return: The result of the action
+        """
+
+        tag = blake2b(secret.encode('UTF-8'), key=self.__tag_key).digest()
+        with self.__lock:
+            self.__expire()
+            if (entry := self.__entries.get(tag)) is not None:
+                self.__entries.move_to_end(tag)
+                return action(entry[1])
+        key = derive(secret)
+        with self.__lock:
+            if (entry := self.__entries.get(tag)) is not None:
+                # Another thread derived the same key meanwhile
+                self.__wipe(key)
+                key = entry[1]
+            else:
+                self.__entries[tag] = (monotonic() + self.__ttl, key)
+                while len(self.__entries) > self.__max_size:
+                    self.__wipe(self.__entries.popitem(last=False)[1][1])
+            return action(key)
+
+    def clear(self) -> None:
+        """Zeroizes and removes every master key."""
+
+        with self.__lock:
+            for _, key in self.__entries.values():
+                self.__wipe(key)
+            self.__entries.clear()
+
+    def __len__(self) -> int:
+        """Counts the master keys held."""
+
+        return len(self.__entries)
+
+    def __expire(self) -> None:
+        """Zeroizes and removes master keys that have outlived the TTL."""
+
+        now = monotonic()
+        for tag in [tag for tag, (expiry, _) in self.__entries.items() if expiry <= now]:
+            self.__wipe(self.__entries.pop(tag)[1])
+
+    @staticmethod
+    def __wipe(key: bytearray) -> None:
+        """Overwrites a key with zeros."""
+
+        key[:] = bytes(len(key))
+
+class KeyDerivation(object):
+    """
+    Seeds password generation from a memory-hard master key. The expensive derivation runs once
+    per master secret, while each service and iteration is derived from the master key with HMAC.
+    """
+
+    ALGORITHMS = ('scrypt', 'pbkdf2')
+
+    __slots__ = '__algorithm', '__cache'
+
+    def __init__(self, algorithm: str = 'scrypt', cache: MasterKeyCache = None) -> None:
+        """
+        Configures the key derivation.
+        :param algorithm: The master key derivation function, 'scrypt' or 'pbkdf2'
+        :param cache: The cache of master keys, defaults to a new cache
+        """
+
+        if algorithm not in KeyDerivation.ALGORITHMS:
+            raise ValueError(f'Unknown key derivation algorithm: {algorithm}')
+        self.__algorithm = algorithm
+        self.__cache = cache if cache is not None else MasterKeyCache()
+
+    def seed(self, service: str, secret: str, iteration: int) -> str:
+        """
+        Derives the seed of a password.
+        :param service: The service of the password
+        :param secret: The master secret
+        :param iteration: The iteration of the password
+        :return: The hexadecimal seed
+        """
+
+        message = '\0'.join([service, str(iteration)]).encode('UTF-8')
+        return self.__cache.use(
+            secret, self.__derive, lambda master_key: hmac.new(master_key, message, sha256).hexdigest()
+        )
+
+    def seeded(self, service: str, secret: str, iteration: int) -> Random:
+        """Creates a pseudorandom generator seeded with the derived seed of a password."""
+
+        return Random(self.seed(service, secret, iteration))
+
+    def __derive(self, secret: str) -> bytearray:
+        """Runs the memory-hard derivation of a master key."""
+
+        password = secret.encode('UTF-8')
+        if self.__algorithm == 'scrypt':
+            key = scrypt(password, salt=SALT, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P, dklen=KEY_LENGTH)
+        else:
+            key = pbkdf2_hmac('sha256', password, SALT, PBKDF2_ITERATIONS, KEY_LENGTH)
+        return bytearray(key)
@@ -0,0 +1,44 @@
+"""
+File: log_format.py
+Description: Parses the input strings logged by the command line and graphical user interfaces
+"""
+
+import re
+
+# Matches exactly what args_to_string() logs, where at least one character type precedes the optional
+# key derivation flag. Only the service and secret may contain spaces, so the other fields are read from the end
+LOG_PATTERN = re.compile(
+    r'(?P<input>.* .*) (?P<iteration>-?[0-9]+) (?P<min_length>-?[0-9]+) '
+    r'-(?=[ulds])(?P<upper>u?)(?P<lower>l?)(?P<digit>d?)(?P<special>s?)(?P<kdf>k?)'
+)
+
+def parse_log_readings(message: str) -> list:
+    """
+    Parses logged input in every way its service and secret may be told apart, which is more than one
+    if either of them contains a space.
+    :param message: The logged input string, formatted as "service secret iteration min_length -options"
+    :return: The input arguments of each reading, in the order accepted by generate(), keeping the
+        iteration as the text it was logged as, since the GUI seeds from that text
+    """
+
+    if (match := LOG_PATTERN.fullmatch(message)) is None:
+        raise ValueError('Log entry is not formatted as "service secret iteration min_length -options"')
+    input, iteration, min_length, *options = match.groups()
+    options = [bool(option) for option in options]
+    separators = [position for position, character in enumerate(input) if character == ' ']
+    return [
+        (input[:separator], input[separator + 1:], iteration, int(min_length), *options)
+        for separator in separators
+    ]
+
+def parse_log(message: str) -> tuple:
+    """
+    Parses logged input whose service and secret can be told apart.
+    :param message: The logged input string, formatted as "service secret iteration min_length -options"
+    :return: The input arguments, in the order accepted by generate()
+    """
+
+    readings = parse_log_readings(message)
+    if len(readings) > 1:
+        raise ValueError('Log entry is ambiguous, as its service or secret contains a space')
+    return readings[0]
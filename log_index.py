@@ -0,0 +1,108 @@
+"""
+File: log_index.py
+Description: Indexes logged input by service for fast searching
+"""
+
+from threading import Lock
+from array import array
+from itertools import chain
+from collections.abc import Iterable
+
+NGRAM_SIZE = 3
+
+class LogIndex(object):
+    """
+    Indexes logged input by service. Queries shorter than NGRAM_SIZE match the start of a service
+    through an index of the services' first NGRAM_SIZE - 1 characters, longer queries match anywhere
+    in it through an n-gram index. Both map their keys to ascending ids, so indexing never sorts.
+    Matching ignores case.
+    """
+
+    __slots__ = '__entries', '__services', '__prefixes', '__ngrams', '__lock'
+
+    def __init__(self, entries: Iterable[str] = ()) -> None:
+        """
+        Builds the index.
+        :param entries: The logged input to index
+        """
+
+        self.__lock = Lock()
+        self.cleared()
+        self.extend(entries)
+
+    def logged(self, message: str) -> None:
+        """Indexes a newly logged message."""
+
+        self.extend((message,))
+
+    def cleared(self) -> None:
+        """Empties the index after the log is cleared."""
+
+        with self.__lock:
+            self.__entries = []
+            self.__services = []
+            self.__prefixes = {}
+            self.__ngrams = {}
+
+    def extend(self, messages: Iterable[str]) -> None:
+        """Indexes logged messages in order."""
+
+        with self.__lock:
+            first_id = len(self.__entries)
+            self.__entries.extend(messages)
+            prefixes, ngrams = self.__prefixes, self.__ngrams
+            for id in range(first_id, len(self.__entries)):
+                service = LogIndex.service(self.__entries[id])
+                self.__services.append(service)
+                if (postings := prefixes.get(prefix := service[:NGRAM_SIZE - 1])) is None:
+                    postings = prefixes[prefix] = array('I')
+                postings.append(id)
+                for ngram in {service[i:i + NGRAM_SIZE] for i in range(len(service) - NGRAM_SIZE + 1)}:
+                    if (postings := ngrams.get(ngram)) is None:
+                        postings = ngrams[ngram] = array('I')
+                    postings.append(id)
+
+    def find(self, query: str) -> list:
+        """
+        Finds the logged input whose service matches a query.
+        :param query: The service prefix or substring to search for
+        :return: The matching logged input, in the order it was indexed
+        """
+
+        query = query.lower()
+        with self.__lock:
+            if not query:
+                return self.__entries[:]
+            if len(query) == NGRAM_SIZE - 1:
+                ids = self.__prefixes.get(query, ())
+            elif len(query) < NGRAM_SIZE:
+                postings = [ids for prefix, ids in self.__prefixes.items() if prefix.startswith(query)]
+                ids = sorted(chain.from_iterable(postings))
+            else:
+                postings = [self.__ngrams.get(query[i:i + NGRAM_SIZE], ()) for i in range(len(query) - NGRAM_SIZE + 1)]
+                # Only the rarest n-gram's postings need checking against the whole query
+                ids = [id for id in min(postings, key=len) if query in self.__services[id]]
+            return [self.__entries[id] for id in ids]
+
+    def __len__(self) -> int:
+        """Counts the indexed entries."""
+
+        return len(self.__entries)
+
+    @staticmethod
+    def service(message: str) -> str:
+        """Extracts the lowercase service of a logged input string."""
+
+        return message.split(' ', 1)[0].lower()
+
+    @staticmethod
+    def matches(query: str, message: str) -> bool:
+        """
+        Checks whether logged input matches a query the same way find() does, without an index.
+        :param query: The service prefix or substring to search for
+        :param message: The logged input string
+        :return: True if the service of the input matches, False otherwise
+        """
+
+        query, service = query.lower(), LogIndex.service(message)
+        return service.startswith(query) if len(query) < NGRAM_SIZE else query in service
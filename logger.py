@@ -5,22 +5,240 @@ Author: Justin Thoreson
 Date: January 2024
 """
 
-class Logger(object):
-    """Logs messages to a file."""
+from mmap import mmap, ACCESS_READ
+from array import array
+from os import fstat, fsync, stat, stat_result, remove, replace, open as os_open, close as os_close, O_RDONLY
+from os.path import abspath, dirname
+from contextlib import contextmanager
+from collections.abc import Iterator
+from stats import timed
 
-    __slots__ = '__file', '__logs'
+try:
+    from fcntl import flock, LOCK_EX, LOCK_UN
+except ImportError:
+    # Advisory locks are unavailable on Windows, where appends and clears are left unlocked
+    flock = None
 
-    def __init__(self, filename: str) -> None:
-        """Opens/creates a log file and reads its contents."""
+BACKENDS = ('text', 'sqlite', 'segmented')
+DIGEST_SIZE = 16
+NEWLINE = ord('\n')
+# Imported once on first use, which keeps hashlib off the startup path of logs that are not lean
+blake2b = None
 
-        self.__file = open(filename, 'a+')
-        self.__logs = self.__read()
+class FlushPolicy(object):
+    """Decides when buffered log messages are written to the log file."""
+
+    __slots__ = 'max_count', 'max_bytes', 'fsync'
+
+    def __init__(
+        self,
+        max_count: int = 1,
+        max_bytes: int = None,
+        fsync: bool = False
+    ) -> None:
+        """
+        Configures the flush policy. A limit of None is never reached, and buffered messages are
+        otherwise only written by flush() and close().
+        :param max_count: The number of buffered messages that triggers a flush
+        :param max_bytes: The number of buffered bytes that triggers a flush
+        :param fsync: Whether to force flushed data onto the disk
+        """
+
+        self.max_count = max_count
+        self.max_bytes = max_bytes
+        self.fsync = fsync
+
+    def due(self, count: int, size: int) -> bool:
+        """
+        Checks whether buffered messages should be flushed.
+        :param count: The number of buffered messages
+        :param size: The number of buffered bytes
+        :return: True if a limit has been reached, False otherwise
+        """
+
+        return (
+            self.max_count is not None and count >= self.max_count
+            or self.max_bytes is not None and size >= self.max_bytes
+        )
+
+class BufferedLog(object):
+    """
+    Buffers logged messages and notifies listeners of changes, which every log backend shares. Buffered
+    messages are written in a single batch by the backend's _write() once its flush policy is due, except
+    for those another process writes in the meantime.
+    """
+
+    __slots__ = '__policy', '__pending', '__pending_messages', '__pending_size', '__listeners'
+
+    def __init__(self, policy: FlushPolicy = None) -> None:
+        """
+        Starts with an empty buffer and no listeners.
+        :param policy: When to write logged messages to storage, defaults to after every message
+        """
+
+        self.__policy = policy or FlushPolicy()
+        self.__pending = []
+        self.__pending_messages = set()
+        self.__pending_size = 0
+        self.__listeners = []
+
+    def subscribe(self, listener: object) -> None:
+        """
+        Notifies a listener of changes to the logs.
+        :param listener: An object with logged(message) and cleared() methods, such as a LogIndex
+        """
+
+        self.__listeners.append(listener)
+
+    @timed('logger.flush')
+    def flush(self) -> None:
+        """Writes all buffered messages to storage in a single batch."""
+
+        if not self.__pending:
+            return
+        self._write()
+        self._discard_pending()
+
+    def close(self) -> None:
+        """Flushes buffered messages and releases the storage."""
+
+        raise NotImplementedError
+
+    def __enter__(self) -> 'BufferedLog':
+        """Uses the logger as a context manager."""
+
+        return self
+
+    def __exit__(self, *exc_info: tuple) -> None:
+        """Closes the logger when leaving its context."""
+
+        self.close()
+
+    @timed('logger.write')
+    def _buffer(self, message: str) -> None:
+        """Buffers a message and flushes the buffer when the policy is due."""
+
+        self.__pending.append(message)
+        self.__pending_messages.add(message)
+        self.__pending_size += len(message.encode('UTF-8')) + 1
+        if self.__policy.due(len(self.__pending), self.__pending_size):
+            self.flush()
+
+    def _pending(self) -> list:
+        """Retrieves the buffered messages in the order they were logged, which callers must not modify."""
+
+        return self.__pending
+
+    def _is_pending(self, message: str) -> bool:
+        """Checks whether a message is buffered."""
+
+        return message in self.__pending_messages
+
+    def _drop_pending(self, message: str) -> bool:
+        """
+        Drops a buffered message which another process has written since, so it is not written twice.
+        :param message: A message read from storage
+        :return: True if the message was buffered, False otherwise
+        """
+
+        if message not in self.__pending_messages:
+            return False
+        self.__pending_messages.remove(message)
+        count = len(self.__pending)
+        self.__pending[:] = [pending for pending in self.__pending if pending != message]
+        self.__pending_size -= (count - len(self.__pending)) * (len(message.encode('UTF-8')) + 1)
+        return True
+
+    def _discard_pending(self) -> None:
+        """Forgets all buffered messages."""
+
+        self.__pending.clear()
+        self.__pending_messages.clear()
+        self.__pending_size = 0
+
+    def _notify_logged(self, message: str) -> None:
+        """Notifies listeners of a logged message."""
+
+        for listener in self.__listeners:
+            listener.logged(message)
+
+    def _notify_cleared(self) -> None:
+        """Notifies listeners that the logs were cleared."""
+
+        for listener in self.__listeners:
+            listener.cleared()
+
+    def _write(self) -> None:
+        """
+        Writes the buffered messages to storage after picking up the messages other processes logged in the
+        meantime, retrieving them through _pending() only then, as picking up messages may drop some.
+        """
+
+        raise NotImplementedError
+
+    def __del__(self) -> None:
+        """Flushes buffered messages and releases the storage."""
+
+        self.close()
+
+class Logger(BufferedLog):
+    """
+    Logs messages to a file that may be shared with other processes. Appends and clears hold an
+    advisory lock on the file, and changes made by other processes are picked up by reading only
+    the bytes appended since the file was last read.
+    """
+
+    __slots__ = (
+        '__filename', '__file', '__logs', '__index', '__unindexed_start', '__unindexed_stop', '__lean', '__map',
+        '__offsets', '__offset', '__locks', '__policy'
+    )
+
+    def __init__(
+        self,
+        filename: str,
+        lean: bool = False,
+        lazy: bool = False,
+        policy: FlushPolicy = None
+    ) -> None:
+        """
+        Opens/creates a log file and reads its contents.
+        :param filename: The name of the log file
+        :param lean: Whether to keep only fixed-size digests of the logs in memory, which a lazy log
+            indexes as the file is first iterated instead of up front
+        :param lazy: Whether to skip reading the file and serve reads from a memory map on demand
+        :param policy: When to write logged messages to the file, defaults to after every message
+        """
+
+        self.__policy = policy = policy or FlushPolicy()
+        super().__init__(policy)
+        self.__filename = filename
+        self.__file = open(filename, 'a+b')
+        self.__lean = lean
+        self.__map = None
+        self.__offsets = array('Q')
+        self.__offset = 0
+        self.__locks = 0
+        self.__logs = self.__index = None
+        self.__unindexed_start = self.__unindexed_stop = 0
+        with self.__locked():
+            self.__offset = fstat(self.__file.fileno()).st_size
+            self.__logs = None if lean or lazy else self.__read()
+        if not lazy:
+            self.__index = {self.__key(log) for log in self}
+        elif lean:
+            # Lookups scan only the part of the file that has not been iterated yet
+            self.__index = set()
+            self.__unindexed_stop = self.__offset
 
     def log(self, message: str) -> None:
         """Logs a message."""
-        
-        self.__logs.append(message)
-        self.__write(message)
+
+        if self.__logs is not None:
+            self.__logs.append(message)
+        if self.__index is not None:
+            self.__index.add(self.__key(message))
+        self._buffer(message)
+        self._notify_logged(message)
 
     def log_if_not_exists(self, message: str) -> bool:
         """
@@ -28,39 +246,353 @@ class Logger(object):
         :param message:
         :return: True if the message was logged, False otherwise
         """
-        
-        if (message_not_exists := message not in self.__logs):
-            self.log(message)
+
+        # Holding the lock keeps other processes from logging the same message in between
+        with self.__locked(sync=True):
+            if (message_not_exists := not self.__contains(message)):
+                self.log(message)
         return message_not_exists
-    
+
     def clear(self) -> None:
         """Clears all logs."""
 
-        self.__logs.clear()
-        self.__erase()
-    
+        self._discard_pending()
+        with self.__locked():
+            self.__reset()
+            self.__erase()
+        self._notify_cleared()
+
+    def refresh(self) -> list:
+        """
+        Picks up the messages other processes logged since the log file was last read, notifying listeners.
+        If another process cleared the log, listeners are notified of that first.
+        :return: The messages picked up
+        """
+
+        return self.__sync()
+
+    def close(self) -> None:
+        """Flushes buffered messages and closes the log file."""
+
+        if self.__file.closed:
+            return
+        try:
+            self.flush()
+        finally:
+            self.__unmap()
+            self.__file.close()
+
     def get_logs(self) -> list:
         """Retrieves a copy of the current logs."""
-        
-        return self.__logs[:]
-    
+
+        return self.__logs[:] if self.__logs is not None else list(self)
+
+    def __iter__(self) -> Iterator[str]:
+        """Iterates over the logs read so far without copying them, later ones being picked up by refresh()."""
+
+        if self.__logs is not None:
+            yield from self.__logs
+            return
+        data = self.__mapped()
+        offsets = self.__offsets
+        start, size = 0, min(len(data), self.__offset)
+        while start < size:
+            end = data.find(b'\n', start)
+            end = size if end < 0 else end
+            message = self.__decode(data[start:end])
+            # The first pass over the file indexes it, unless the log was cleared, which replaces the offsets
+            if start == self.__unindexed_start < self.__unindexed_stop and offsets is self.__offsets:
+                self.__index.add(self.__key(message))
+                self.__unindexed_start = end + 1
+            yield message
+            start = end + 1
+
+    def __len__(self) -> int:
+        """Counts the logs."""
+
+        return len(self.__logs) if self.__logs is not None else len(self.__indexed())
+
+    def __getitem__(self, key: int | slice) -> str | list:
+        """Retrieves a log, or a list of logs, by position."""
+
+        if self.__logs is not None:
+            return self.__logs[key]
+        offsets = self.__indexed()
+        if isinstance(key, slice):
+            return [self.__line(offsets, i) for i in range(*key.indices(len(offsets)))]
+        if key < 0:
+            key += len(offsets)
+        if not 0 <= key < len(offsets):
+            raise IndexError('log index out of range')
+        return self.__line(offsets, key)
+
+    @timed('logger.lookup')
+    def __contains(self, message: str) -> bool:
+        """Checks whether a message exists in the logs."""
+
+        if self.__index is not None:
+            if self.__key(message) in self.__index:
+                return True
+            if self.__unindexed_start >= self.__unindexed_stop:
+                return False
+        data = self.__mapped()
+        if self.__index is None:
+            start, stop = 0, len(data)
+        else:
+            start, stop = self.__unindexed_start, self.__unindexed_stop
+        # Search the part of the mapped file the index does not cover for the message on a line of its own
+        line = message.encode('UTF-8')
+        return (
+            data[start:start + len(line) + 1] == line + b'\n'
+            or data.find(b'\n' + line + b'\n', max(start - 1, 0), stop) >= 0
+            or start < stop and data[stop - 1] != NEWLINE
+            and data[max(stop - len(line) - 1, start):stop] in (line, b'\n' + line)
+        )
+
+    def __key(self, message: str) -> str | bytes:
+        """Creates the index key of a message, a digest of it in lean mode."""
+
+        if not self.__lean:
+            return message
+        global blake2b
+        if blake2b is None:
+            from hashlib import blake2b
+        return blake2b(message.encode('UTF-8'), digest_size=DIGEST_SIZE).digest()
+
+    @timed('logger.map')
+    def __mapped(self) -> mmap | bytes:
+        """Maps the current contents of the log file into memory."""
+
+        self.flush()
+        size = fstat(self.__file.fileno()).st_size
+        if self.__map is not None and len(self.__map) != size:
+            # Iterators may still hold the previous map, which is released once they finish
+            self.__map = None
+        if self.__map is None:
+            if size == 0:
+                return b''
+            self.__map = mmap(self.__file.fileno(), size, access=ACCESS_READ)
+        return self.__map
+
+    def __unmap(self) -> None:
+        """Releases the memory map."""
+
+        if self.__map is not None:
+            self.__map.close()
+            self.__map = None
+
+    def __indexed(self) -> array:
+        """Extends the line offset index to cover the logs read so far."""
+
+        data = self.__mapped()
+        offsets = self.__offsets
+        size = min(len(data), self.__offset)
+        start = 0
+        if offsets:
+            # Resume after the last indexed line, which may have grown since
+            end = data.find(b'\n', offsets[-1])
+            start = size if end < 0 else end + 1
+        while start < size:
+            offsets.append(start)
+            end = data.find(b'\n', start)
+            start = size if end < 0 else end + 1
+        return offsets
+
+    def __line(self, offsets: array, i: int) -> str:
+        """Decodes the line at a position in the offset index."""
+
+        data = self.__map
+        start = offsets[i]
+        end = data.find(b'\n', start)
+        return self.__decode(data[start:len(data) if end < 0 else end])
+
+    @staticmethod
+    def __decode(line: bytes) -> str:
+        """Decodes a line read from the mapped file."""
+
+        return line.decode('UTF-8').removesuffix('\r')
+
+    @timed('logger.read')
     def __read(self) -> list:
         """Reads all lines from the log file."""
 
         self.__file.seek(0)
-        return self.__file.read().splitlines()
-    
-    def __write(self, message: str) -> None:
-        """Writes a message to the log file."""
+        return self.__file.read(self.__offset).decode('UTF-8').splitlines()
+
+    @timed('logger.sync')
+    def __sync(self) -> list:
+        """
+        Catches up with the changes other processes made to the log file, notifying listeners.
+        :return: The messages other processes appended since the file was last read
+        """
+
+        opened = fstat(self.__file.fileno())
+        # While the lock is held, no other process can clear the log
+        if (flock is None or not self.__locks) and (self.__replaced(opened) or opened.st_size < self.__offset):
+            # Another process cleared the log
+            self.__file.close()
+            self.__file = open(self.__filename, 'a+b')
+            self.__reset()
+            self._notify_cleared()
+            # Buffered messages are still to be written to the new file
+            for message in self._pending():
+                self._notify_logged(message)
+            opened = fstat(self.__file.fileno())
+        size = opened.st_size
+        if size == self.__offset:
+            return []
+        self.__file.seek(self.__offset)
+        data = self.__file.read(size - self.__offset)
+        # Only whole lines are read, a line still being written is picked up once complete
+        end = data.rfind(b'\n') + 1
+        self.__offset += end
+        # A buffered message another process wrote meanwhile is already in the logs, and is not written again
+        messages = [
+            message for message in map(self.__decode, data[:end].split(b'\n')[:-1]) if not self._drop_pending(message)
+        ]
+        for message in messages:
+            if self.__logs is not None:
+                self.__logs.append(message)
+            if self.__index is not None:
+                self.__index.add(self.__key(message))
+            self._notify_logged(message)
+        return messages
+
+    def __replaced(self, opened: stat_result = None) -> bool:
+        """
+        Checks whether the log file has been replaced or removed since it was opened.
+        :param opened: The status of the opened file, if already known
+        """
+
+        try:
+            current = stat(self.__filename)
+        except FileNotFoundError:
+            return True
+        opened = opened or fstat(self.__file.fileno())
+        return (current.st_dev, current.st_ino) != (opened.st_dev, opened.st_ino)
+
+    def __reset(self) -> None:
+        """Forgets the logs read so far, keeping buffered messages which are still to be written."""
+
+        if self.__logs is not None:
+            self.__logs.clear()
+        if self.__index is not None:
+            self.__index.clear()
+        for message in self._pending():
+            if self.__logs is not None:
+                self.__logs.append(message)
+            if self.__index is not None:
+                self.__index.add(self.__key(message))
+        # Iterators may still hold the previous map, which is released once they finish
+        self.__map = None
+        self.__offsets = array('Q')
+        self.__offset = 0
+        self.__unindexed_start = self.__unindexed_stop = 0
+
+    @contextmanager
+    def __locked(self, sync: bool = False) -> Iterator[None]:
+        """
+        Holds an exclusive advisory lock on the log file, reentrantly.
+        :param sync: Whether to catch up with other processes once the lock is first acquired
+        """
+
+        if flock is None or self.__locks:
+            self.__locks += 1
+            try:
+                if sync and self.__locks == 1:
+                    self.__sync()
+                yield
+            finally:
+                self.__locks -= 1
+            return
+        while True:
+            flock(self.__file.fileno(), LOCK_EX)
+            if not self.__replaced():
+                break
+            # The file was cleared while waiting, so lock the new one instead
+            flock(self.__file.fileno(), LOCK_UN)
+            self.__sync()
+        self.__locks += 1
+        try:
+            if sync:
+                self.__sync()
+            yield
+        finally:
+            self.__locks -= 1
+            # Clearing replaces the file, whose old lock was released when it was closed
+            flock(self.__file.fileno(), LOCK_UN)
+
+    def _write(self) -> None:
+        """Appends buffered messages to the log file."""
+
+        # Messages other processes appended come before the buffered ones in the file
+        with self.__locked(sync=True):
+            if not (messages := self._pending()):
+                return
+            self.__file.write(''.join(f'{message}\n' for message in messages).encode('UTF-8'))
+            self.__file.flush()
+            if self.__policy.fsync:
+                fsync(self.__file.fileno())
+            self.__offset = fstat(self.__file.fileno()).st_size
 
-        self.__file.write(f'{message}\n')
-    
     def __erase(self) -> None:
-        """Erases all contents of the log file."""
+        """
+        Atomically replaces the log file with an empty one, or empties it in place where it cannot be
+        replaced while another process has it open, as on Windows.
+        """
 
-        self.__file.truncate(0)
+        from shutil import copymode
+        from tempfile import mkstemp
+        directory = dirname(abspath(self.__filename))
+        if flock is None:
+            # Windows refuses to replace a file this process still has open or mapped
+            self.__unmap()
+            self.__file.close()
+        descriptor, temp_filename = mkstemp(dir=directory, prefix='.log-')
+        os_close(descriptor)
+        try:
+            copymode(self.__filename, temp_filename)
+            replace(temp_filename, self.__filename)
+        except OSError:
+            remove(temp_filename)
+            if flock is not None:
+                raise
+            with open(self.__filename, 'r+b') as file:
+                file.truncate()
+        else:
+            self.__file.close()
+            if self.__policy.fsync and flock is not None:
+                # Persist the rename itself, where directories can be opened
+                directory_descriptor = os_open(directory, O_RDONLY)
+                try:
+                    fsync(directory_descriptor)
+                finally:
+                    os_close(directory_descriptor)
+        self.__file = open(self.__filename, 'a+b')
 
-    def __del__(self) -> None:
-        """Closes the log file."""
+def open_logger(
+    filename: str,
+    backend: str = 'text',
+    lean: bool = False,
+    lazy: bool = False,
+    policy: FlushPolicy = None
+) -> 'Logger | SQLiteLogger | SegmentedLogger':
+    """
+    Opens a log with the chosen storage backend.
+    :param filename: The name of the log file, or directory of a segmented log
+    :param backend: The storage backend, one of BACKENDS
+    :param lean: Whether a text log keeps only fixed-size digests of the logs in memory
+    :param lazy: Whether a text log serves reads from a memory map on demand
+    :param policy: When to write logged messages to storage
+    :return: The opened log
+    """
 
-        self.__file.close()
\ No newline at end of file
+    if backend == 'sqlite':
+        from sqlite_logger import SQLiteLogger
+        return SQLiteLogger(filename, policy)
+    if backend == 'segmented':
+        from segmented_logger import SegmentedLogger
+        return SegmentedLogger(filename, policy=policy)
+    if backend != 'text':
+        raise ValueError(f'Unknown log backend: {backend}')
+    return Logger(filename, lean, lazy, policy)
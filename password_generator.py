@@ -5,31 +5,62 @@ Author: Justin Thoreson
 Date: January 2024
 """
 
-from hashlib import sha256
-from base64 import b64encode
-from random import seed, sample, choices, shuffle
+from random import Random
+from collections.abc import Iterable, Iterator
+from functools import lru_cache
+from stats import timed
+import random
+
+# The longest minimum length the CLI and GUI generate, longer ones being clamped to it
+MAX_MIN_LENGTH = 250
+# Imported once on first use, which keeps them off the startup path of commands that never seed
+sha256 = b2a_base64 = None
 
 class PasswordGenerator(object):
     """Handles password generation."""
 
+    # Bump whenever the password generated for an input changes, and regenerate the golden vectors
+    SCHEME_VERSION = 1
     UPPER = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
     LOWER = 'abcdefghijklmnopqrstuvwxyz'
     DIGIT = '0123456789'
     SPECIAL = '?!@#$%^&*'
+    # The ASCII codes of each character type, in the order generate() samples them
+    CLASS_TABLES = (UPPER.encode('ascii'), LOWER.encode('ascii'), DIGIT.encode('ascii'), SPECIAL.encode('ascii'))
 
     @staticmethod
+    @timed('generator.seed')
     def seed(string: str):
         """Seeds the pseudorandom generation."""
 
-        seed(PasswordGenerator.__hash(string))
+        random.seed(PasswordGenerator.__hash(string))
+
+    @staticmethod
+    @timed('generator.seeded')
+    def seeded(string: str) -> Random:
+        """
+        Creates an independent pseudorandom generator seeded the same way as seed().
+        :param string: The string to seed the generator with
+        :return: A seeded generator that does not share the global state
+        """
+
+        return Random(PasswordGenerator.__hash(string))
+
+    @staticmethod
+    def composite_seed(service: str, secret: str, iteration: int) -> str:
+        """Creates the seed string for a service, secret and iteration."""
+
+        return ''.join([service, secret, str(iteration)])
     
     @staticmethod
+    @timed('generator.generate')
     def generate(
         min_length: int,
         include_upper: bool = True,
         include_lower: bool = True,
         include_digit: bool = True,
-        include_special: bool = True
+        include_special: bool = True,
+        rng: Random = None
     ) -> str:
         """
         Generates a password.
@@ -38,19 +69,161 @@ class PasswordGenerator(object):
         :param lower: Whether to include lowercase letters
         :param number: Whether to include numbers
         :param special: Whether to include special characters
+        :param rng: The generator to draw from, defaults to the global state set by seed()
         :return: A generated password
         """
 
+        rng = random if rng is None else rng
         num_components = include_upper + include_lower + include_digit + include_special
         if num_components <= 0:
             raise ValueError('Password must include at least one character type')
         num_each = PasswordGenerator.__ceil_div(min_length, num_components)
-        uppers = PasswordGenerator.__sample(PasswordGenerator.UPPER, num_each) if include_upper else ''
-        lowers = PasswordGenerator.__sample(PasswordGenerator.LOWER, num_each) if include_lower else ''
-        digits = PasswordGenerator.__sample(PasswordGenerator.DIGIT, num_each) if include_digit else ''
-        specials = PasswordGenerator.__sample(PasswordGenerator.SPECIAL, num_each) if include_special else ''
+        uppers = PasswordGenerator.__sample(PasswordGenerator.UPPER, num_each, rng) if include_upper else ''
+        lowers = PasswordGenerator.__sample(PasswordGenerator.LOWER, num_each, rng) if include_lower else ''
+        digits = PasswordGenerator.__sample(PasswordGenerator.DIGIT, num_each, rng) if include_digit else ''
+        specials = PasswordGenerator.__sample(PasswordGenerator.SPECIAL, num_each, rng) if include_special else ''
         composite = ''.join([uppers, lowers, digits, specials])
-        return PasswordGenerator.__shuffle(composite)
+        return PasswordGenerator.__shuffle(composite, rng)
+
+    @staticmethod
+    def length(
+        min_length: int,
+        include_upper: bool = True,
+        include_lower: bool = True,
+        include_digit: bool = True,
+        include_special: bool = True,
+        exact: bool = False
+    ) -> int:
+        """
+        Calculates the length of the passwords generated for a minimum length and options.
+        :param min_length: The minimum length of the password
+        :param include_upper: Whether to include uppercase letters
+        :param include_lower: Whether to include lowercase letters
+        :param include_digit: Whether to include digits
+        :param include_special: Whether to include special characters
+        :param exact: Whether the password is exactly min_length long instead of rounded up
+        :return: The length of the password
+        """
+
+        num_components = include_upper + include_lower + include_digit + include_special
+        if num_components <= 0:
+            raise ValueError('Password must include at least one character type')
+        if exact:
+            if min_length < num_components:
+                raise ValueError('Exact length must allow at least one character of each type')
+            return min_length
+        return PasswordGenerator.__ceil_div(min_length, num_components) * num_components
+
+    @staticmethod
+    @timed('generator.generate_into')
+    def generate_into(
+        buffer: bytearray | memoryview,
+        min_length: int,
+        include_upper: bool = True,
+        include_lower: bool = True,
+        include_digit: bool = True,
+        include_special: bool = True,
+        rng: Random = None,
+        exact: bool = False
+    ) -> int:
+        """
+        Generates a password as ASCII into the start of a writable buffer, without creating strings
+        holding its characters. Unless exact, the password is the same as generate() would return.
+        :param buffer: The buffer to write to, at least length() bytes long
+        :param min_length: The minimum length of the password
+        :param include_upper: Whether to include uppercase letters
+        :param include_lower: Whether to include lowercase letters
+        :param include_digit: Whether to include digits
+        :param include_special: Whether to include special characters
+        :param rng: The generator to draw from, defaults to the global state set by seed()
+        :param exact: Whether the password is exactly min_length long, the first character types
+            selected receiving one character more than the others when it does not divide evenly
+        :return: The number of bytes written
+        """
+
+        rng = random if rng is None else rng
+        included = (include_upper, include_lower, include_digit, include_special)
+        length = PasswordGenerator.length(min_length, *included, exact=exact)
+        view = memoryview(buffer).cast('B')
+        if view.readonly:
+            raise TypeError('Buffer must be writable')
+        if len(view) < length:
+            raise ValueError(f'Buffer must hold at least {length} bytes')
+        tables = [table for table, include in zip(PasswordGenerator.CLASS_TABLES, included) if include]
+        draw, start = rng.random, 0
+        for i, table in enumerate(tables):
+            stop, size = start + length // len(tables) + (i < length % len(tables)), len(table)
+            # Draws the same values as the choices() call of __sample
+            for position in range(start, stop):
+                view[position] = table[int(draw() * size)]
+            start = stop
+        # Shuffling positions draws the same values as shuffling the characters themselves in __shuffle
+        order = list(range(length))
+        rng.shuffle(order)
+        PasswordGenerator.__permute(view, order)
+        return length
+
+    @staticmethod
+    def generate_bytes(
+        min_length: int,
+        include_upper: bool = True,
+        include_lower: bool = True,
+        include_digit: bool = True,
+        include_special: bool = True,
+        rng: Random = None,
+        exact: bool = False
+    ) -> bytearray:
+        """
+        Generates a password as ASCII into a new buffer, which can be wiped after use.
+        :param min_length: The minimum length of the password
+        :param include_upper: Whether to include uppercase letters
+        :param include_lower: Whether to include lowercase letters
+        :param include_digit: Whether to include digits
+        :param include_special: Whether to include special characters
+        :param rng: The generator to draw from, defaults to the global state set by seed()
+        :param exact: Whether the password is exactly min_length long instead of rounded up
+        :return: The generated password
+        """
+
+        options = (include_upper, include_lower, include_digit, include_special)
+        buffer = bytearray(PasswordGenerator.length(min_length, *options, exact=exact))
+        PasswordGenerator.generate_into(buffer, min_length, *options, rng=rng, exact=exact)
+        return buffer
+
+    @staticmethod
+    def wipe(buffer: bytearray | memoryview) -> None:
+        """Overwrites a writable buffer, such as a generated password, with zeros."""
+
+        view = memoryview(buffer).cast('B')
+        view[:] = bytes(len(view))
+
+    @staticmethod
+    def generate_many(specs: Iterable[tuple]) -> Iterator[str]:
+        """
+        Generates a password for each spec, each from its own seeded generator.
+        :param specs: Tuples of (service, secret, iteration, min_length, options),
+            where options is a tuple of (upper, lower, digit, special) flags
+        :return: The generated passwords, in the order of the specs
+        """
+
+        for service, secret, iteration, min_length, options in specs:
+            rng = PasswordGenerator.seeded(
+                PasswordGenerator.composite_seed(service, secret, iteration)
+            )
+            yield PasswordGenerator.generate(min_length, *options, rng=rng)
+
+    @staticmethod
+    def seed_digest(string: str) -> bytes:
+        """
+        Hashes a seed string into the seed material of every generation scheme.
+        :param string: The string to seed with
+        :return: The SHA-256 digest of the encoded string
+        """
+
+        global sha256
+        if sha256 is None:
+            from hashlib import sha256
+        return sha256(PasswordGenerator.__encode(string)).digest()
 
     @staticmethod
     def __hash(data: str) -> str:
@@ -60,13 +233,17 @@ class PasswordGenerator(object):
         :return: The hexadecimal string representation of the hashed data
         """
 
-        return sha256(PasswordGenerator.__encode(data)).hexdigest()
+        return PasswordGenerator.seed_digest(data).hex()
 
     @staticmethod
     def __encode(data: str) -> bytes:
         """Encodes data to base 64."""
 
-        return b64encode(data.encode('UTF-8'))
+        # Equivalent to base64.b64encode, without importing re along with the base64 module
+        global b2a_base64
+        if b2a_base64 is None:
+            from binascii import b2a_base64
+        return b2a_base64(data.encode('UTF-8'), newline=False)
 
     @staticmethod
     def __ceil_div(dividend: int, divisor: int) -> int:
@@ -75,21 +252,89 @@ class PasswordGenerator(object):
         return -(dividend // -divisor)
 
     @staticmethod
-    def __sample(data: str, count: int, allow_duplicates: bool = True) -> str:
+    def __sample(data: str, count: int, rng: Random, allow_duplicates: bool = True) -> str:
         """
         Samples characters from a string pseudorandomly.
         :param data: The string to sample characters from
         :param count: The number of characters to sample
+        :param rng: The generator to draw from
         :param allow_duplicates: Whether duplicate selections are allowed
         """
 
-        selection = choices(data, k=count) if allow_duplicates else sample(data, k=count)
+        selection = rng.choices(data, k=count) if allow_duplicates else rng.sample(data, k=count)
         return ''.join(selection)
 
     @staticmethod
-    def __shuffle(data: str) -> str:
+    def __permute(view: memoryview, order: list) -> None:
+        """
+        Rearranges bytes in place so that position i receives the byte at order[i], following each
+        cycle of the permutation with a single byte held aside.
+        :param view: The bytes to rearrange
+        :param order: The permutation, which is consumed
+        """
+
+        for start in range(len(order)):
+            if order[start] < 0:
+                continue
+            held, current = view[start], start
+            while (source := order[current]) != start:
+                view[current] = view[source]
+                order[current], current = -1, source
+            view[current] = held
+            order[current] = -1
+
+    @staticmethod
+    def __shuffle(data: str, rng: Random) -> str:
         """Shuffles characters in a string."""
 
         data_l = list(data)
-        shuffle(data_l)
+        rng.shuffle(data_l)
         return ''.join(data_l)
+
+@lru_cache(maxsize=None)
+def key_derivation() -> 'KeyDerivation':
+    """Creates the key derivation shared by every password generated with kdf=True."""
+
+    from kdf import KeyDerivation
+    return KeyDerivation()
+
+def generate(
+    service: str, secret: str, iteration: int | str, min_length: int,
+    upper: bool, lower: bool, digit: bool, special: bool, kdf: bool = False
+) -> str:
+    """
+    Generates the password the CLI and GUI generate for the input arguments.
+    :param iteration: The iteration, as a number or as the text it was entered as, which is part of the seed
+    :param kdf: Whether to seed the password from the memory-hard key derivation of the secret
+    :return: The generated password
+    """
+
+    if kdf:
+        rng = key_derivation().seeded(service, secret, iteration)
+    else:
+        rng = PasswordGenerator.seeded(PasswordGenerator.composite_seed(service, secret, iteration))
+    min_length = MAX_MIN_LENGTH if min_length > MAX_MIN_LENGTH else min_length
+    return PasswordGenerator.generate(min_length, upper, lower, digit, special, rng=rng)
+
+def args_to_string(
+    service: str, secret: str, iteration: int | str, min_length: int,
+    upper: bool, lower: bool, digit: bool, special: bool, kdf: bool = False
+) -> str:
+    """Creates a string from the input arguments"""
+
+    options = options_to_string(upper, lower, digit, special, kdf)
+    return ' '.join(
+        [service, secret, str(iteration), str(min_length), options]
+    )
+
+def options_to_string(
+    upper: bool, lower: bool, digit: bool, special: bool, kdf: bool = False
+) -> str:
+    """Creates a string from the input options."""
+
+    return ''.join(['-',
+        ('u' if upper else ''),
+        ('l' if lower else ''),
+        ('d' if digit else ''),
+        ('s' if special else ''),
+        ('k' if kdf else '')])
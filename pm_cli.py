@@ -5,35 +5,64 @@ Author: Justin Thoreson
 Date: January 2024
 """
 
-from argparse import ArgumentParser
-from password_generator import PasswordGenerator
-from logger import Logger
+from password_generator import generate, args_to_string, options_to_string
+from logger import Logger, FlushPolicy, BACKENDS, open_logger
+from collections.abc import Iterable, Iterator
+from io import TextIOBase
+from types import SimpleNamespace
+from contextlib import contextmanager
+from time import perf_counter
+from stats import Stats, timed
+import sys
 
 LOG_FILENAME = 'log'
-MAX_MIN_LENGTH = 250
+DATABASE_LOG_FILENAME = 'log.db'
+SEGMENTED_LOG_DIRECTORY = 'log.d'
+BATCH_FLUSH_COUNT = 1000
+SPEC_FIELDS = ('service', 'secret', 'iteration', 'min_length')
+OPTION_FIELDS = ('upper', 'lower', 'digit', 'special', 'kdf')
+SHORT_OPTIONS = 'uldsk'
+# Each command is selected by an option flag, so services may share their names
+COMMANDS = {
+    'serve': 'serve password requests over a local socket',
+    'client': 'ask the running daemon for the password instead of generating it',
+    'migrate': 'copy the text log into the SQLite log',
+    'compact': 'merge the sealed segments of the segmented log, dropping duplicates',
+    'export': 'regenerate the password of every logged input',
+    'audit': 'find the logged input that generated leaked passwords',
+}
 
-def parse_args() -> tuple:
-    """Parses command line arguments."""
-    
-    arg_parser = ArgumentParser()
+def parse_args(argv: list = None, client: bool = False) -> 'Namespace':
+    """
+    Parses command line arguments.
+    :param argv: The arguments to parse, defaults to those of the process
+    :param client: Whether to parse the arguments of the client command
+    """
+
+    from argparse import ArgumentParser
+    arg_parser = ArgumentParser(prog='pm_cli.py --client' if client else None)
     arg_parser.add_argument(
         'service',
         type=str,
+        nargs='?',
         help='the service in which to generate a password for'
     )
     arg_parser.add_argument(
         'secret',
         type=str,
+        nargs='?',
         help='a secret phrase'
     )
     arg_parser.add_argument(
         'iteration',
         type=int,
+        nargs='?',
         help='the number of times this password has been generated'
     )
     arg_parser.add_argument(
         'min_length',
         type=int,
+        nargs='?',
         help='the minimum length of the password'
     )
     arg_parser.add_argument(
@@ -56,52 +85,534 @@ def parse_args() -> tuple:
         action='store_true',
         help='include special characters'
     )
-    return vars(arg_parser.parse_args()).values()
+    arg_parser.add_argument(
+        '-k', '--kdf',
+        action='store_true',
+        help='seed the password from a memory-hard key derivation of the secret'
+    )
+    if client:
+        add_socket_argument(arg_parser)
+    else:
+        arg_parser.add_argument(
+            '-b', '--batch',
+            nargs='?',
+            const='-',
+            metavar='PATH',
+            help='generate passwords for the specs in a file, or stdin if no file is given'
+        )
+        arg_parser.add_argument(
+            '-f', '--format',
+            choices=('jsonl', 'csv'),
+            help='the format of the batch specs, inferred from the file extension by default'
+        )
+        arg_parser.add_argument(
+            '--find',
+            metavar='QUERY',
+            help='list the logged input whose service matches a prefix (under three characters) or substring'
+        )
+        add_log_backend_argument(arg_parser)
+        add_stats_arguments(arg_parser)
+        commands = arg_parser.add_argument_group('commands', 'each accepts its own arguments, listed by -h after it')
+        for command, description in COMMANDS.items():
+            commands.add_argument(f'--{command}', action='store_true', help=description)
+    # The positional arguments are optional for --batch and --find, so they are parsed after every option, as they
+    # would be if they were required
+    args = arg_parser.parse_intermixed_args(argv)
+    args.batch = getattr(args, 'batch', None)
+    args.find = getattr(args, 'find', None)
+    given = [getattr(args, field) is not None for field in SPEC_FIELDS]
+    modes = [mode for mode in ('batch', 'find') if getattr(args, mode) is not None]
+    if len(modes) > 1:
+        arg_parser.error('--batch and --find cannot be combined')
+    if modes and any(given):
+        arg_parser.error(f'positional arguments cannot be combined with --{modes[0]}')
+    if not modes and not all(given):
+        missing = [field for field, is_given in zip(SPEC_FIELDS, given) if not is_given]
+        arg_parser.error(f'the following arguments are required: {", ".join(missing)}')
+    return args
 
-def log_args(args: tuple) -> None:
-    """Logs the provided arguments to a file."""
+def parse_spec_args(argv: list) -> SimpleNamespace | None:
+    """
+    Parses the arguments of a single password without importing argparse, which dominates startup.
+    Only options and four adjacent positional arguments are accepted, which argparse parses the same.
+    :param argv: The arguments to parse
+    :return: The parsed arguments, or None if they need parse_args()
+    """
+
+    flags = dict.fromkeys(OPTION_FIELDS, False)
+    positions = []
+    for position, arg in enumerate(argv):
+        if arg.startswith('--'):
+            if arg[2:] not in flags:
+                return None
+            flags[arg[2:]] = True
+        elif arg.startswith('-'):
+            if len(arg) == 1 or arg[1:].strip(SHORT_OPTIONS):
+                return None
+            for option in arg[1:]:
+                flags[OPTION_FIELDS[SHORT_OPTIONS.index(option)]] = True
+        else:
+            positions.append(position)
+    if len(positions) != len(SPEC_FIELDS) or positions[-1] - positions[0] != len(SPEC_FIELDS) - 1:
+        return None
+    service, secret, iteration, min_length = (argv[position] for position in positions)
+    try:
+        iteration, min_length = int(iteration), int(min_length)
+    except ValueError:
+        return None
+    return SimpleNamespace(
+        service=service, secret=secret, iteration=iteration, min_length=min_length, **flags,
+        batch=None, format=None, find=None, log_backend='text', stats=False, stats_format='text'
+    )
+
+def split_command(argv: list) -> tuple:
+    """
+    Finds the flag selecting a command, which may appear anywhere before a "--" separator.
+    :param argv: The arguments to search
+    :return: The command, or None to generate a password, and the remaining arguments
+    """
+
+    end = argv.index('--') if '--' in argv else len(argv)
+    for position, arg in enumerate(argv[:end]):
+        if arg.startswith('--') and arg[2:] in COMMANDS:
+            return arg[2:], argv[:position] + argv[position + 1:]
+    return None, argv
+
+def parse_serve_args(argv: list) -> 'Namespace':
+    """Parses the arguments of the serve command."""
+
+    from argparse import ArgumentParser
+    arg_parser = ArgumentParser(prog='pm_cli.py --serve', description=COMMANDS['serve'])
+    add_socket_argument(arg_parser)
+    add_log_backend_argument(arg_parser)
+    add_stats_arguments(arg_parser)
+    return arg_parser.parse_args(argv)
+
+def parse_migrate_args(argv: list) -> 'Namespace':
+    """Parses the arguments of the migrate command."""
+
+    from argparse import ArgumentParser
+    arg_parser = ArgumentParser(prog='pm_cli.py --migrate', description=COMMANDS['migrate'])
+    arg_parser.add_argument('--source', default=LOG_FILENAME, help='the text log to read')
+    arg_parser.add_argument('--target', default=DATABASE_LOG_FILENAME, help='the SQLite log to write')
+    return arg_parser.parse_args(argv)
+
+def parse_compact_args(argv: list) -> 'Namespace':
+    """Parses the arguments of the compact command."""
+
+    from argparse import ArgumentParser
+    arg_parser = ArgumentParser(prog='pm_cli.py --compact', description=COMMANDS['compact'])
+    arg_parser.add_argument('--directory', default=SEGMENTED_LOG_DIRECTORY, help='the segmented log to compact')
+    return arg_parser.parse_args(argv)
+
+def parse_export_args(argv: list) -> 'Namespace':
+    """Parses the arguments of the export command."""
+
+    from argparse import ArgumentParser
+    arg_parser = ArgumentParser(prog='pm_cli.py --export', description=COMMANDS['export'])
+    arg_parser.add_argument(
+        '-o', '--output',
+        default='-',
+        metavar='PATH',
+        help='the file to write, created readable only by the current user, or stdout by default'
+    )
+    arg_parser.add_argument(
+        '-f', '--format',
+        choices=('jsonl', 'csv'),
+        help='the format of the export, inferred from the output file extension by default'
+    )
+    arg_parser.add_argument(
+        '-w', '--workers',
+        type=int,
+        default=1,
+        help='the number of processes regenerating passwords'
+    )
+    add_log_backend_argument(arg_parser)
+    add_stats_arguments(arg_parser)
+    args = arg_parser.parse_args(argv)
+    if args.workers < 1:
+        arg_parser.error('--workers must be at least 1')
+    return args
+
+def parse_audit_args(argv: list) -> 'Namespace':
+    """Parses the arguments of the audit command."""
+
+    from argparse import ArgumentParser
+
+    def iteration_range(value: str) -> range:
+        """Parses an inclusive range of iterations such as "1-20"."""
 
-    def args_to_string(
-        service: str, secret: str, iteration: int, min_length: int,
-        upper: bool, lower: bool, digit: bool, special: bool
-    ) -> str:
-        """Creates a string from the input arguments"""
+        first, separator, last = value.partition('-')
+        if not separator or not first.isdigit() or not last.isdigit() or int(first) > int(last):
+            raise ValueError(value)
+        return range(int(first), int(last) + 1)
 
-        options = options_to_string(upper, lower, digit, special)
-        return ' '.join(
-            [service, secret, str(iteration), str(min_length), options]
+    arg_parser = ArgumentParser(prog='pm_cli.py --audit', description=COMMANDS['audit'])
+    arg_parser.add_argument(
+        'passwords',
+        nargs='*',
+        help='the passwords to look for, read a line at a time from stdin if none are given'
+    )
+    arg_parser.add_argument(
+        '-i', '--iterations',
+        type=iteration_range,
+        metavar='FIRST-LAST',
+        help='also try these iterations for every logged service, secret, length and options'
+    )
+    arg_parser.add_argument(
+        '-a', '--all',
+        action='store_true',
+        help='report every match instead of stopping once each password is found'
+    )
+    arg_parser.add_argument(
+        '-w', '--workers',
+        type=int,
+        default=1,
+        help='the number of processes regenerating passwords'
+    )
+    add_log_backend_argument(arg_parser)
+    add_stats_arguments(arg_parser)
+    args = arg_parser.parse_args(argv)
+    if args.workers < 1:
+        arg_parser.error('--workers must be at least 1')
+    return args
+
+def add_log_backend_argument(arg_parser: 'ArgumentParser') -> None:
+    """Adds the log storage backend option to a parser."""
+
+    arg_parser.add_argument(
+        '--log-backend',
+        choices=BACKENDS,
+        default='text',
+        help=(
+            f'how the log is stored: "{LOG_FILENAME}" as text, "{DATABASE_LOG_FILENAME}" as SQLite '
+            f'or "{SEGMENTED_LOG_DIRECTORY}" as size-capped text segments'
         )
+    )
+
+def add_stats_arguments(arg_parser: 'ArgumentParser') -> None:
+    """Adds the statistics report options to a parser."""
+
+    arg_parser.add_argument(
+        '--stats',
+        action='store_true',
+        help='print timing statistics to stderr when done'
+    )
+    arg_parser.add_argument(
+        '--stats-format',
+        choices=('text', 'json'),
+        default='text',
+        help='the format of the timing statistics'
+    )
+
+def add_socket_argument(arg_parser: 'ArgumentParser') -> None:
+    """Adds the daemon socket path option to a parser."""
+
+    from daemon import default_socket_path
+    arg_parser.add_argument(
+        '--socket',
+        default=default_socket_path(),
+        metavar='PATH',
+        help='the Unix domain socket of the daemon'
+    )
 
-    def options_to_string(
-        upper: bool, lower: bool, digit: bool, special: bool
-    ) -> str:
-        """Creates a string from the input options."""
+def open_log(backend: str, **kwargs: dict) -> Logger:
+    """
+    Opens the log stored with a backend.
+    :param backend: The storage backend, one of BACKENDS
+    :param kwargs: Additional options for open_logger()
+    """
 
-        return ''.join(['-',
-            ('u' if upper else ''),
-            ('l' if lower else ''),
-            ('d' if digit else ''),
-            ('s' if special else '')])
+    filename = {'sqlite': DATABASE_LOG_FILENAME, 'segmented': SEGMENTED_LOG_DIRECTORY}.get(backend, LOG_FILENAME)
+    return open_logger(filename, backend, **kwargs)
+
+def log_args(args: tuple, backend: str = 'text') -> None:
+    """Logs the provided arguments to a file."""
 
     log = args_to_string(*args)
-    logger = Logger(LOG_FILENAME)
-    logger.log_if_not_exists(log)
+    with open_log(backend, lazy=True) as logger:
+        logger.log_if_not_exists(log)
 
-def main() -> None:
-    """Runs the password manager program."""
+def read_specs(stream: TextIOBase, format: str) -> Iterator[tuple]:
+    """
+    Lazily reads batch specs from a stream.
+    :param stream: The stream of JSONL or CSV specs
+    :param format: The format of the specs, either 'jsonl' or 'csv'
+    :return: Tuples of (line number, record), where the record is a dictionary or the error that prevented reading it
+    """
+
+    if format == 'csv':
+        from csv import DictReader
+        reader = DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+        return
+    import json
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            record = e
+        yield line_number, record
+
+def record_to_args(record: dict) -> tuple:
+    """
+    Converts a batch spec record into input arguments.
+    :param record: The spec read from JSONL or CSV
+    :return: The input arguments, in the order accepted by generate()
+    """
+
+    def to_bool(value: bool | str | None) -> bool:
+        """Interprets a JSON or CSV option value."""
+
+        if isinstance(value, str):
+            value = value.strip().lower()
+            if value not in ('', '0', '1', 'false', 'true'):
+                raise ValueError(f'Invalid option value: {value}')
+            return value in ('1', 'true')
+        return bool(value)
+
+    def to_int(field: str) -> int:
+        """Interprets a JSON or CSV integer value, rejecting booleans and fractional numbers."""
+
+        value = record[field]
+        if isinstance(value, float) and value.is_integer():
+            return int(value)
+        if isinstance(value, str):
+            return int(value.strip())
+        if isinstance(value, int) and not isinstance(value, bool):
+            return value
+        raise ValueError(f'Invalid {field}: {value!r}')
+
+    if not isinstance(record, dict):
+        raise ValueError('Spec must be an object')
+    missing = [field for field in SPEC_FIELDS if record.get(field) is None]
+    if missing:
+        raise ValueError(f'Spec is missing: {", ".join(missing)}')
+    service, secret = str(record['service']), str(record['secret'])
+    iteration, min_length = to_int('iteration'), to_int('min_length')
+    options = [to_bool(record.get(field)) for field in OPTION_FIELDS]
+    return service, secret, iteration, min_length, *options
+
+def process_batch(records: Iterable[tuple], logger: Logger) -> Iterator[dict]:
+    """
+    Generates and logs the password for each batch spec as it arrives.
+    :param records: Tuples of (line number, record) as produced by read_specs()
+    :param logger: The logger that records the input of each generated password
+    :return: A result per spec holding either its password or its error
+    """
+
+    for line_number, record in records:
+        try:
+            if isinstance(record, Exception):
+                raise record
+            args = record_to_args(record)
+            password = generate(*args)
+        except (ValueError, TypeError, OverflowError) as e:
+            yield {'line': line_number, 'error': str(e)}
+        else:
+            logger.log_if_not_exists(args_to_string(*args))
+            yield {'line': line_number, 'password': password}
+
+def run_batch(path: str, format: str | None, backend: str = 'text') -> None:
+    """
+    Generates passwords for a batch of specs, streaming a JSON result per line to stdout.
+    :param path: The file to read specs from, '-' for stdin
+    :param format: The format of the specs, inferred from the file extension if None
+    :param backend: The storage backend of the log
+    """
+
+    import json
+    format = format or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+    stream = sys.stdin if path == '-' else open(path, newline='', encoding='UTF-8')
+    policy = FlushPolicy(max_count=BATCH_FLUSH_COUNT)
+    try:
+        with open_log(backend, lean=True, policy=policy) as logger:
+            for result in process_batch(read_specs(stream, format), logger):
+                # Each result is flushed, so a consumer reading from a pipe sees it before the batch ends
+                print(json.dumps(result), flush=True)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+def find_logs(query: str, backend: str = 'text') -> None:
+    """
+    Prints the logged input whose service matches a query.
+    :param query: The service prefix or substring to search for
+    :param backend: The storage backend of the log
+    """
+
+    from log_index import LogIndex
 
-    args = parse_args()
-    service, secret, iteration, min_length, upper, lower, digit, special = args
-    composite_seed = ''.join([service, secret, str(iteration)])
-    PasswordGenerator.seed(composite_seed)
+    # A single query scans the log once, which is cheaper than building an index first
+    with open_log(backend, lazy=True) as logger:
+        for message in logger:
+            if LogIndex.matches(query, message):
+                print(message)
+
+def serve(socket_path: str, backend: str = 'text') -> None:
+    """Keeps the generator and log loaded, answering client requests over a local socket."""
+
+    from daemon import Daemon
+    from threading import Lock
+
+    logger_lock = Lock()
+    with open_log(backend) as logger:
+        @timed('daemon.request')
+        def handle(record: dict) -> dict:
+            """Generates and logs the password for a client request, possibly alongside other requests."""
+
+            args = record_to_args(record)
+            password = generate(*args)
+            # Passwords are generated concurrently, but the log is not safe to share between threads
+            with logger_lock:
+                logger.log_if_not_exists(args_to_string(*args))
+            return {'password': password}
+
+        Daemon(socket_path, handle).run()
+
+def run_export(path: str, format: str | None, workers: int = 1, backend: str = 'text') -> None:
+    """
+    Regenerates the password of every logged input, streaming a record per log entry.
+    :param path: The file to write, '-' for stdout
+    :param format: The format of the records, either 'jsonl' or 'csv', inferred from the file extension if None
+    :param workers: The number of processes regenerating passwords
+    :param backend: The storage backend of the log
+    """
+
+    from vault_export import export_logs, EXPORT_FIELDS
+    import os
+    format = format or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+    if path == '-':
+        stream = sys.stdout
+    else:
+        # The export holds every secret and password, so it is never readable by others
+        stream = os.fdopen(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w', newline='', encoding='UTF-8')
     try:
-        min_length = MAX_MIN_LENGTH if min_length > MAX_MIN_LENGTH else min_length
-        password = PasswordGenerator.generate(min_length, upper, lower, digit, special)
+        if format == 'csv':
+            from csv import DictWriter
+            writer = DictWriter(stream, EXPORT_FIELDS)
+            writer.writeheader()
+            write = writer.writerow
+        else:
+            import json
+            write = lambda record: stream.write(json.dumps(record) + '\n')
+        with open_log(backend, lazy=True) as logger:
+            for record in export_logs(logger, workers):
+                write(record)
+                # Records are streamed to a consumer reading stdout as they are regenerated
+                if stream is sys.stdout:
+                    stream.flush()
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+
+def run_audit(parsed: 'Namespace') -> None:
+    """Reports the logged input that generated each password, exiting with an error if one is not found."""
+
+    from audit import audit_logs
+    import json
+    passwords = parsed.passwords or [line.rstrip('\r\n') for line in sys.stdin]
+    passwords = [password for password in passwords if password]
+    found = set()
+    with open_log(parsed.log_backend, lazy=True) as logger:
+        for entry, args, password in audit_logs(logger, passwords, parsed.iterations, parsed.workers, parsed.all):
+            found.add(password)
+            service, _, iteration, min_length, *options = args
+            print(json.dumps({
+                'password': password, 'entry': entry, 'service': service, 'iteration': iteration,
+                'min_length': min_length, 'options': options_to_string(*options)
+            }), flush=True)
+    if missing := len(set(passwords) - found):
+        sys.exit(f'{missing} of {len(set(passwords))} passwords were not generated by any logged input')
+
+def run_client(parsed: 'Namespace') -> None:
+    """Asks a running daemon for the password of the parsed input arguments."""
+
+    from daemon import request
+
+    record = {field: getattr(parsed, field) for field in SPEC_FIELDS + OPTION_FIELDS}
+    try:
+        response = request(parsed.socket, record)
+    except OSError as e:
+        sys.exit(f'Could not reach the daemon at {parsed.socket}: {e.strerror or e}')
+    print(response.get('password', response.get('error')))
+
+@contextmanager
+def collect_stats(parsed: 'Namespace') -> Iterator[None]:
+    """Collects statistics while running a command if requested, reporting them to stderr afterwards."""
+
+    if not parsed.stats:
+        yield
+        return
+    Stats.enable()
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        Stats.record('cli.main', perf_counter() - start)
+        print(Stats.report(parsed.stats_format), file=sys.stderr)
+
+def run(parsed: 'Namespace') -> None:
+    """Runs the batch, find or single generation mode of parsed arguments."""
+
+    if parsed.batch is not None:
+        run_batch(parsed.batch, parsed.format, parsed.log_backend)
+        return
+    if parsed.find is not None:
+        find_logs(parsed.find, parsed.log_backend)
+        return
+    args = (
+        parsed.service, parsed.secret, parsed.iteration, parsed.min_length,
+        parsed.upper, parsed.lower, parsed.digit, parsed.special, parsed.kdf
+    )
+    try:
+        password = generate(*args)
     except ValueError as e:
         print(e)
     else:
         print(password)
-        log_args(args)
+        log_args(args, parsed.log_backend)
+
+def main() -> None:
+    """Runs the password manager program."""
+
+    command, argv = split_command(sys.argv[1:])
+    if command == 'serve':
+        parsed = parse_serve_args(argv)
+        with collect_stats(parsed):
+            serve(parsed.socket, parsed.log_backend)
+        return
+    if command == 'migrate':
+        from sqlite_logger import migrate
+        parsed = parse_migrate_args(argv)
+        print(f'{parsed.target} holds {migrate(parsed.source, parsed.target)} logs')
+        return
+    if command == 'compact':
+        from segmented_logger import SegmentedLogger
+        parsed = parse_compact_args(argv)
+        with SegmentedLogger(parsed.directory) as logger:
+            dropped = logger.compact()
+            print(f'{parsed.directory} holds {len(logger)} logs after dropping {dropped} duplicates')
+        return
+    if command == 'export':
+        parsed = parse_export_args(argv)
+        with collect_stats(parsed):
+            run_export(parsed.output, parsed.format, parsed.workers, parsed.log_backend)
+        return
+    if command == 'audit':
+        parsed = parse_audit_args(argv)
+        with collect_stats(parsed):
+            run_audit(parsed)
+        return
+    if command == 'client':
+        run_client(parse_args(argv, client=True))
+        return
+    parsed = parse_spec_args(argv) or parse_args(argv)
+    with collect_stats(parsed):
+        run(parsed)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
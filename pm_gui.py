@@ -5,12 +5,47 @@ Author: Justin Thoreson
 Date: January 2024
 """
 
-from gui import GUI
+from argparse import ArgumentParser, Namespace
+from logger import BACKENDS
+from stats import Stats
+import sys
+
+def parse_args() -> Namespace:
+    """Parses command line arguments."""
+
+    arg_parser = ArgumentParser()
+    arg_parser.add_argument(
+        '--log-backend',
+        choices=BACKENDS,
+        default='text',
+        help='how the log is stored: "log" as text, "log.db" as SQLite or "log.d" as size-capped text segments'
+    )
+    arg_parser.add_argument(
+        '--stats',
+        action='store_true',
+        help='print timing statistics to stderr when the window closes'
+    )
+    arg_parser.add_argument(
+        '--stats-format',
+        choices=('text', 'json'),
+        default='text',
+        help='the format of the timing statistics'
+    )
+    return arg_parser.parse_args()
 
 def main() -> None:
     """Runs the password manager program."""
     
-    GUI().render()
+    args = parse_args()
+    if args.stats:
+        Stats.enable()
+    # Imported after parsing so that --help and argument errors do not load Tk
+    from gui import GUI
+    try:
+        GUI(args.log_backend).render()
+    finally:
+        if args.stats:
+            print(Stats.report(args.stats_format), file=sys.stderr)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
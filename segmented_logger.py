@@ -0,0 +1,507 @@
+"""
+File: segmented_logger.py
+Description: Logs messages to a directory of size-capped segment files
+"""
+
+from logger import Logger, BufferedLog, FlushPolicy, DIGEST_SIZE
+from hashlib import blake2b
+from bisect import bisect_left
+from heapq import merge
+from mmap import mmap, ACCESS_READ
+from contextlib import contextmanager
+from itertools import islice
+from tempfile import mkstemp
+from typing import BinaryIO, Iterator
+from stats import timed
+import os
+
+try:
+    from fcntl import flock, LOCK_EX, LOCK_UN
+except ImportError:
+    # Advisory locks are unavailable on Windows, where writes are left unlocked
+    flock = None
+
+SEGMENT_SIZE = 1 << 20
+MAX_SEGMENTS = 8
+SEGMENT_SUFFIX = '.log'
+INDEX_SUFFIX = '.idx'
+LOCK_FILENAME = 'lock'
+
+def digest(message: str) -> bytes:
+    """Creates the fixed-size digest a message is indexed by."""
+
+    return blake2b(message.encode('UTF-8'), digest_size=DIGEST_SIZE).digest()
+
+def read_lines(file: str | BinaryIO, size: int = None) -> Iterator[str]:
+    """
+    Reads the lines of a segment through a memory map.
+    :param file: The segment file, or its filename
+    :param size: The number of bytes to read, the whole file if None
+    """
+
+    if isinstance(file, str):
+        with open(file, 'rb') as file:
+            yield from read_lines(file, size)
+        return
+    size = os.fstat(file.fileno()).st_size if size is None else size
+    if size == 0:
+        return
+    with mmap(file.fileno(), 0, access=ACCESS_READ) as data:
+        start = 0
+        while start < size:
+            end = data.find(b'\n', start, size)
+            end = size if end < 0 else end
+            yield data[start:end].decode('UTF-8').removesuffix('\r')
+            start = end + 1
+
+def index_keys(index: mmap | bytes) -> Iterator[bytes]:
+    """Iterates over the digests of a sorted segment index."""
+
+    for start in range(0, len(index), DIGEST_SIZE):
+        yield index[start:start + DIGEST_SIZE]
+
+class SegmentedLogger(BufferedLog):
+    """
+    Logs messages to a directory of segment files, sharing the interface of Logger. Messages are
+    appended to the active segment until it reaches a size or entry cap, when it is sealed with a
+    sorted index of message digests and a new active segment is started. Sealed segments are only
+    read on demand, so opening the log takes the same time and memory however long it has grown.
+    Compaction merges the sealed segments into one, dropping duplicates.
+
+    Segment files are named after a generation, which clearing the log increments, and a number
+    within it. Writers in different processes are serialized by an advisory lock on a lock file.
+    """
+
+    __slots__ = (
+        '__directory', '__max_bytes', '__max_entries', '__max_segments', '__policy', '__lock_descriptor', '__locks',
+        '__segments', '__version', '__indexes', '__active', '__active_file', '__active_digests', '__active_count',
+        '__active_size'
+    )
+
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: int = SEGMENT_SIZE,
+        max_entries: int = None,
+        max_segments: int = MAX_SEGMENTS,
+        policy: FlushPolicy = None
+    ) -> None:
+        """
+        Opens/creates a segmented log, reading only its active segment.
+        :param directory: The directory holding the segment files
+        :param max_bytes: The size in bytes at which the active segment is sealed, never if None
+        :param max_entries: The number of entries at which the active segment is sealed, never if None
+        :param max_segments: The number of sealed segments beyond which they are compacted, never if None
+        :param policy: When to write logged messages to the active segment, defaults to after every message
+        """
+
+        self.__policy = policy = policy or FlushPolicy()
+        super().__init__(policy)
+        self.__lock_descriptor = None
+        os.makedirs(directory, exist_ok=True)
+        self.__directory = directory
+        self.__max_bytes = max_bytes
+        self.__max_entries = max_entries
+        self.__max_segments = max_segments
+        self.__indexes = {}
+        self.__active = None
+        self.__locks = 0
+        # The lock file also holds a version which every change to the set of segments increments
+        self.__lock_descriptor = os.open(os.path.join(directory, LOCK_FILENAME), os.O_RDWR | os.O_CREAT, 0o644)
+        with self.__locked():
+            self.__version = self.__read_version()
+            self.__segments = self.__list() or [(0, 0)]
+            self.__open_active()
+
+    def log(self, message: str) -> None:
+        """Logs a message."""
+
+        self._buffer(message)
+        self._notify_logged(message)
+
+    def log_if_not_exists(self, message: str) -> bool:
+        """
+        Logs a message only if it does not already exist in the logs.
+        :param message:
+        :return: True if the message was logged, False otherwise
+        """
+
+        # Holding the lock keeps other processes from logging the same message in between
+        with self.__locked(sync=True):
+            if (message_not_exists := not self.__contains(message)):
+                self.log(message)
+        return message_not_exists
+
+    def clear(self) -> None:
+        """Clears all logs."""
+
+        self._discard_pending()
+        with self.__locked():
+            segments = self.__list(every_generation=True)
+            generation = max(generation for generation, _ in segments + self.__segments) + 1
+            self.__active.close()
+            self.__indexes.clear()
+            # The new generation starts before the old one is removed, so the directory is never empty
+            self.__segments = [(generation, 0)]
+            self.__open_active()
+            for segment in segments:
+                self.__remove(segment)
+            self.__increment_version()
+        self._notify_cleared()
+
+    def refresh(self) -> list:
+        """
+        Picks up the messages other processes logged since the log was last read, notifying listeners.
+        If another process cleared the log, or compacted the segment this log was appending to,
+        listeners are notified of a clear first and every message is picked up again.
+        :return: The messages picked up
+        """
+
+        return self.__sync()
+
+    @timed('logger.compact')
+    def compact(self) -> int:
+        """
+        Merges the sealed segments into one, keeping only the first occurrence of each message.
+        :return: The number of duplicate messages dropped
+        """
+
+        with self.__locked(sync=True):
+            self.flush()
+            return self.__compact()
+
+    def get_logs(self) -> list:
+        """Retrieves a copy of the current logs."""
+
+        return list(self)
+
+    def close(self) -> None:
+        """Flushes buffered messages and closes the active segment."""
+
+        if self.__lock_descriptor is None:
+            return
+        try:
+            self.flush()
+        finally:
+            self.__active.close()
+            self.__indexes.clear()
+            os.close(self.__lock_descriptor)
+            self.__lock_descriptor = None
+
+    def __iter__(self) -> Iterator[str]:
+        """
+        Iterates over the logs a segment at a time, picking up the messages other processes logged until
+        it starts, later ones being picked up by refresh().
+        """
+
+        self.flush()
+        # Compaction or a clear may remove or replace segments while they are iterated, which leaves the
+        # contents of already opened files intact, so every segment is opened before any is read
+        files = []
+        try:
+            with self.__locked(sync=True):
+                for segment in self.__segments:
+                    files.append(open(self.__path(segment), 'rb'))
+                active_size = self.__active_size
+            *sealed, active = files
+            for file in sealed:
+                yield from read_lines(file)
+            yield from read_lines(active, active_size)
+        finally:
+            for file in files:
+                file.close()
+
+    def __len__(self) -> int:
+        """Counts the logs."""
+
+        self.flush()
+        return sum(self.__count(segment) for segment in self.__segments)
+
+    def __getitem__(self, key: int | slice) -> str | list:
+        """Retrieves a log, or a list of logs, by position."""
+
+        length = len(self)
+        if isinstance(key, slice):
+            start, stop, step = key.indices(length)
+            if step < 0:
+                return [self[i] for i in range(start, stop, step)]
+            return list(islice(self, start, stop, step))
+        if key < 0:
+            key += length
+        if not 0 <= key < length:
+            raise IndexError('log index out of range')
+        for segment in self.__segments:
+            if key < (count := self.__count(segment)):
+                size = self.__active_size if segment == self.__segments[-1] else None
+                return next(islice(read_lines(self.__path(segment), size), key, None))
+            key -= count
+
+    @timed('logger.lookup')
+    def __contains(self, message: str) -> bool:
+        """Checks whether a message exists in the logs, searching the sealed segments' indexes."""
+
+        if self._is_pending(message):
+            return True
+        key = digest(message)
+        if key in self.__active_digests:
+            return True
+        for segment in self.__segments[:-1]:
+            index = self.__index(segment)
+            count = len(index) // DIGEST_SIZE
+            i = bisect_left(range(count), key, key=lambda i: index[i * DIGEST_SIZE:(i + 1) * DIGEST_SIZE])
+            if i < count and index[i * DIGEST_SIZE:(i + 1) * DIGEST_SIZE] == key:
+                return True
+        return False
+
+    def __compact(self) -> int:
+        """Merges the sealed segments while the lock is held, returning the number of duplicates dropped."""
+
+        sealed = self.__segments[:-1]
+        if not sealed:
+            return 0
+        target = sealed[-1]
+        indexes = [self.__index(segment) for segment in sealed]
+        # Merging the sorted indexes finds the duplicated digests without holding every digest in memory
+        duplicates = set()
+        index_descriptor, index_filename = mkstemp(dir=self.__directory, prefix='.compact-')
+        with open(index_descriptor, 'wb') as file:
+            previous = None
+            for key in merge(*map(index_keys, indexes)):
+                if key == previous:
+                    duplicates.add(key)
+                else:
+                    file.write(key)
+                previous = key
+        dropped = 0
+        segment_descriptor, segment_filename = mkstemp(dir=self.__directory, prefix='.compact-')
+        with open(segment_descriptor, 'wb') as file:
+            written = set()
+            for segment in sealed:
+                for message in read_lines(self.__path(segment)):
+                    if (key := digest(message)) in duplicates:
+                        if key in written:
+                            dropped += 1
+                            continue
+                        written.add(key)
+                    file.write(f'{message}\n'.encode('UTF-8'))
+            if self.__policy.fsync:
+                file.flush()
+                os.fsync(file.fileno())
+        self.__indexes.clear()
+        # The merged segment replaces the last sealed one before the others are removed, so no message is ever missing
+        os.replace(segment_filename, self.__path(target))
+        os.replace(index_filename, self.__path(target, INDEX_SUFFIX))
+        for segment in sealed[:-1]:
+            self.__remove(segment)
+        self.__segments = [target, self.__segments[-1]]
+        self.__increment_version()
+        return dropped
+
+    def __count(self, segment: tuple) -> int:
+        """Counts the logs in a segment, reading only the size of a sealed segment's index."""
+
+        if segment == self.__segments[-1]:
+            return self.__active_count
+        self.__index(segment)
+        return os.path.getsize(self.__path(segment, INDEX_SUFFIX)) // DIGEST_SIZE
+
+    def __full(self) -> bool:
+        """Checks whether the active segment has reached its cap."""
+
+        return (
+            self.__max_bytes is not None and self.__active_size >= self.__max_bytes
+            or self.__max_entries is not None and self.__active_count >= self.__max_entries
+        )
+
+    def __rotate(self) -> None:
+        """Seals the active segment and starts a new one, compacting once there are too many sealed segments."""
+
+        self.__active.close()
+        generation, number = self.__segments[-1]
+        # The index is written before the new segment exists, so every sealed segment other processes see has one
+        self.__write_index(self.__segments[-1])
+        self.__segments.append((generation, number + 1))
+        self.__open_active()
+        self.__increment_version()
+        if self.__max_segments is not None and len(self.__segments) - 1 > self.__max_segments:
+            self.__compact()
+
+    @timed('logger.sync')
+    def __sync(self) -> list:
+        """
+        Catches up with the segments other processes appended to, sealed, compacted or cleared, notifying listeners.
+        :return: The messages other processes logged since the log was last read
+        """
+
+        version = self.__read_version()
+        if version == self.__version:
+            messages = self.__active.refresh()
+            self.__account(messages)
+        else:
+            # Segments were added or removed
+            self.__version = version
+            active = self.__segments[-1]
+            segments = self.__list() or [(active[0] + 1, 0)]
+            messages = []
+            if segments[-1][0] != active[0] or self.__compacted(active):
+                # After a clear, or a compaction which merged away the messages already read from the
+                # active segment, the whole log is read again
+                self._notify_cleared()
+                # Buffered messages are still to be written
+                for message in self._pending():
+                    self._notify_logged(message)
+                newer = segments
+            else:
+                messages = self.__active.refresh()
+                self.__account(messages)
+                newer = [segment for segment in segments if segment > active]
+            # Compaction may have replaced a sealed segment under the same name
+            self.__indexes.clear()
+            self.__segments = segments
+            if newer:
+                self.__active.close()
+                for segment in newer[:-1]:
+                    messages.extend(read_lines(self.__path(segment)))
+                messages.extend(self.__open_active())
+        # A buffered message another process wrote meanwhile is already known to listeners, and is not written again
+        messages = [message for message in messages if not self._drop_pending(message)]
+        for message in messages:
+            self._notify_logged(message)
+        return messages
+
+    def _write(self) -> None:
+        """Appends buffered messages to the active segment, sealing it whenever it fills up."""
+
+        # Messages other processes appended come before the buffered ones
+        with self.__locked(sync=True):
+            for message in self._pending():
+                if self.__full():
+                    self.__active.flush()
+                    self.__rotate()
+                self.__active.log(message)
+                self.__active_digests.add(digest(message))
+                self.__active_count += 1
+                self.__active_size += len(message.encode('UTF-8')) + 1
+            self.__active.flush()
+
+    def __compacted(self, segment: tuple) -> bool:
+        """Checks whether compaction removed or replaced the segment last opened as the active one."""
+
+        try:
+            current = os.stat(self.__path(segment))
+        except FileNotFoundError:
+            return True
+        return (current.st_dev, current.st_ino) != self.__active_file
+
+    def __account(self, messages: list) -> None:
+        """Adds messages other processes appended to the active segment to its digests and counts."""
+
+        for message in messages:
+            self.__active_digests.add(digest(message))
+            self.__active_size += len(message.encode('UTF-8')) + 1
+        self.__active_count += len(messages)
+
+    def __open_active(self) -> list:
+        """
+        Opens the last segment as the active one, creating it if needed.
+        :return: The messages already in the segment
+        """
+
+        filename = self.__path(self.__segments[-1])
+        # Messages are buffered by this logger, so the segment is only written when flushed
+        self.__active = Logger(filename, lazy=True, policy=FlushPolicy(max_count=None, fsync=self.__policy.fsync))
+        opened = os.stat(filename)
+        self.__active_file = opened.st_dev, opened.st_ino
+        messages = list(self.__active)
+        self.__active_digests = {digest(message) for message in messages}
+        self.__active_count = len(messages)
+        self.__active_size = sum(len(message.encode('UTF-8')) + 1 for message in messages)
+        return messages
+
+    def __index(self, segment: tuple) -> mmap | bytes:
+        """Maps the sorted digest index of a sealed segment into memory, writing the index if it is missing."""
+
+        if (index := self.__indexes.get(segment)) is not None:
+            return index
+        filename = self.__path(segment, INDEX_SUFFIX)
+        if not os.path.exists(filename):
+            self.__write_index(segment)
+        with open(filename, 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            index = mmap(file.fileno(), size, access=ACCESS_READ) if size else b''
+        self.__indexes[segment] = index
+        return index
+
+    def __write_index(self, segment: tuple) -> None:
+        """Atomically writes the sorted digest index of a segment."""
+
+        keys = sorted(digest(message) for message in read_lines(self.__path(segment)))
+        descriptor, temp_filename = mkstemp(dir=self.__directory, prefix='.index-')
+        with open(descriptor, 'wb') as file:
+            file.write(b''.join(keys))
+        os.replace(temp_filename, self.__path(segment, INDEX_SUFFIX))
+
+    def __list(self, every_generation: bool = False) -> list:
+        """
+        Lists the segments in the directory in order.
+        :param every_generation: Whether to include the segments of earlier generations left behind by a clear
+        :return: The generation and number of each segment
+        """
+
+        segments = []
+        for filename in os.listdir(self.__directory):
+            name, suffix = os.path.splitext(filename)
+            generation, _, number = name.partition('-')
+            if suffix == SEGMENT_SUFFIX and generation.isdigit() and number.isdigit():
+                segments.append((int(generation), int(number)))
+        segments.sort()
+        if segments and not every_generation:
+            segments = [segment for segment in segments if segment[0] == segments[-1][0]]
+        return segments
+
+    def __path(self, segment: tuple, suffix: str = SEGMENT_SUFFIX) -> str:
+        """Creates the filename of a segment or of its index."""
+
+        generation, number = segment
+        return os.path.join(self.__directory, f'{generation:06d}-{number:08d}{suffix}')
+
+    def __remove(self, segment: tuple) -> None:
+        """Removes a segment and its index."""
+
+        for suffix in (SEGMENT_SUFFIX, INDEX_SUFFIX):
+            try:
+                os.remove(self.__path(segment, suffix))
+            except FileNotFoundError:
+                pass
+
+    def __read_version(self) -> int:
+        """Reads the version of the set of segments from the lock file."""
+
+        os.lseek(self.__lock_descriptor, 0, os.SEEK_SET)
+        return int.from_bytes(os.read(self.__lock_descriptor, 8), 'little')
+
+    def __increment_version(self) -> None:
+        """Lets other processes know the set of segments changed, while the lock is held."""
+
+        self.__version = self.__read_version() + 1
+        os.lseek(self.__lock_descriptor, 0, os.SEEK_SET)
+        os.write(self.__lock_descriptor, self.__version.to_bytes(8, 'little'))
+
+    @contextmanager
+    def __locked(self, sync: bool = False) -> Iterator[None]:
+        """
+        Holds an exclusive advisory lock on the log directory, reentrantly.
+        :param sync: Whether to catch up with other processes once the lock is first acquired
+        """
+
+        if flock is not None and not self.__locks:
+            flock(self.__lock_descriptor, LOCK_EX)
+        self.__locks += 1
+        try:
+            if sync and self.__locks == 1:
+                self.__sync()
+            yield
+        finally:
+            self.__locks -= 1
+            if flock is not None and not self.__locks:
+                flock(self.__lock_descriptor, LOCK_UN)
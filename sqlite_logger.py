@@ -0,0 +1,246 @@
+"""
+File: sqlite_logger.py
+Description: Logs messages to an indexed SQLite database
+"""
+
+from logger import Logger, BufferedLog, FlushPolicy
+from log_format import parse_log
+from typing import Iterator
+from stats import timed
+import sqlite3
+
+PAGE_SIZE = 1000
+MIGRATION_BATCH_SIZE = 10000
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS logs (
+        id INTEGER PRIMARY KEY,
+        message TEXT NOT NULL UNIQUE,
+        service TEXT,
+        secret TEXT,
+        iteration TEXT,
+        min_length INTEGER,
+        options TEXT
+    );
+    CREATE INDEX IF NOT EXISTS logs_service ON logs (service);
+    CREATE INDEX IF NOT EXISTS logs_iteration ON logs (iteration);
+    CREATE INDEX IF NOT EXISTS logs_options ON logs (options);
+    CREATE TABLE IF NOT EXISTS clears (count INTEGER NOT NULL);
+    INSERT INTO clears SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM clears);
+"""
+
+def split_message(message: str) -> tuple:
+    """
+    Splits a logged input string into its fields, the same way the log is parsed for exporting and auditing.
+    :param message: The input string, formatted as "service secret iteration min_length -options"
+    :return: The service, secret, iteration, minimum length and options, or Nones if the message does not match
+        or its service or secret contains a space, which makes the fields ambiguous
+    """
+
+    try:
+        service, secret, iteration, min_length, *_ = parse_log(message)
+    except ValueError:
+        return None, None, None, None, None
+    return service, secret, iteration, min_length, message.rsplit(' ', 1)[1]
+
+class SQLiteLogger(BufferedLog):
+    """
+    Logs messages to a SQLite database in WAL mode, sharing the interface of Logger. Changes made by
+    other processes are picked up through the ids of the rows inserted since the database was last read.
+    """
+
+    __slots__ = '__connection', '__last_id', '__clears'
+
+    def __init__(self, filename: str, policy: FlushPolicy = None) -> None:
+        """
+        Opens/creates a log database.
+        :param filename: The name of the database file
+        :param policy: When to write logged messages to the database, defaults to after every message
+        """
+
+        policy = policy or FlushPolicy()
+        super().__init__(policy)
+        self.__connection = None
+        # Callers serialize access themselves, e.g. the GUI's worker thread behind a lock
+        self.__connection = sqlite3.connect(filename, isolation_level=None, check_same_thread=False)
+        self.__connection.execute('PRAGMA journal_mode=WAL')
+        self.__connection.execute(f'PRAGMA synchronous={"FULL" if policy.fsync else "NORMAL"}')
+        self.__connection.executescript(SCHEMA)
+        with self.__transaction(immediate=False):
+            self.__last_id, = self.__connection.execute('SELECT COALESCE(MAX(id), 0) FROM logs').fetchone()
+            self.__clears, = self.__connection.execute('SELECT count FROM clears').fetchone()
+
+    def log(self, message: str) -> None:
+        """Logs a message."""
+
+        self._buffer(message)
+        self._notify_logged(message)
+
+    def log_if_not_exists(self, message: str) -> bool:
+        """
+        Logs a message only if it does not already exist in the logs.
+        :param message:
+        :return: True if the message was logged, False otherwise
+        """
+
+        if (message_not_exists := not self.__contains(message)):
+            self.log(message)
+        return message_not_exists
+
+    def clear(self) -> None:
+        """Clears all logs."""
+
+        self._discard_pending()
+        with self.__transaction():
+            self.__connection.execute('DELETE FROM logs')
+            # Lets other processes tell a clear apart from their own deletions
+            self.__connection.execute('UPDATE clears SET count = count + 1')
+            self.__clears, = self.__connection.execute('SELECT count FROM clears').fetchone()
+            self.__last_id = 0
+        self._notify_cleared()
+
+    def refresh(self) -> list:
+        """
+        Picks up the messages other processes logged since the database was last read, notifying listeners.
+        If another process cleared the log, listeners are notified of that first.
+        :return: The messages picked up
+        """
+
+        with self.__transaction(immediate=False):
+            return self.__sync()
+
+    def get_logs(self) -> list:
+        """Retrieves a copy of the current logs."""
+
+        return list(self)
+
+    def find(self, service: str = None, iteration: str = None, options: str = None) -> list:
+        """
+        Retrieves the logs matching fields through their indexes.
+        :param service: The service to match, any if None
+        :param iteration: The iteration to match, any if None
+        :param options: The options to match, such as '-ulds', any if None
+        :return: The matching logs in the order they were logged
+        """
+
+        self.flush()
+        conditions = {'service': service, 'iteration': iteration, 'options': options}
+        conditions = {column: value for column, value in conditions.items() if value is not None}
+        where = ' AND '.join(f'{column} = ?' for column in conditions) or '1'
+        rows = self.__connection.execute(f'SELECT message FROM logs WHERE {where} ORDER BY id', tuple(conditions.values()))
+        return [message for message, in rows]
+
+    def close(self) -> None:
+        """Flushes buffered messages and closes the database."""
+
+        if self.__connection is None:
+            return
+        try:
+            self.flush()
+        finally:
+            self.__connection.close()
+            self.__connection = None
+
+    def __iter__(self) -> Iterator[str]:
+        """Iterates over the logs read so far, a page at a time, later ones being picked up by refresh()."""
+
+        self.flush()
+        last_id = self.__last_id
+        after_id = 0
+        while page := self.__connection.execute(
+            'SELECT id, message FROM logs WHERE id > ? AND id <= ? ORDER BY id LIMIT ?', (after_id, last_id, PAGE_SIZE)
+        ).fetchall():
+            after_id = page[-1][0]
+            yield from (message for _, message in page)
+
+    def __len__(self) -> int:
+        """Counts the logs."""
+
+        self.flush()
+        return self.__connection.execute('SELECT COUNT(*) FROM logs').fetchone()[0]
+
+    def __getitem__(self, key: int | slice) -> str | list:
+        """Retrieves a log, or a list of logs, by position."""
+
+        self.flush()
+        length = len(self)
+        if isinstance(key, slice):
+            start, stop, step = key.indices(length)
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            rows = self.__connection.execute(
+                'SELECT message FROM logs ORDER BY id LIMIT ? OFFSET ?', (max(0, stop - start), start)
+            )
+            return [message for message, in rows]
+        if key < 0:
+            key += length
+        if not 0 <= key < length:
+            raise IndexError('log index out of range')
+        return self.__connection.execute('SELECT message FROM logs ORDER BY id LIMIT 1 OFFSET ?', (key,)).fetchone()[0]
+
+    @timed('logger.lookup')
+    def __contains(self, message: str) -> bool:
+        """Checks whether a message exists in the logs, using the unique index."""
+
+        if self._is_pending(message):
+            return True
+        return self.__connection.execute('SELECT 1 FROM logs WHERE message = ?', (message,)).fetchone() is not None
+
+    def __sync(self) -> list:
+        """
+        Catches up with the changes other processes made to the database within a transaction, notifying listeners.
+        :return: The messages other processes inserted since the database was last read
+        """
+
+        clears, = self.__connection.execute('SELECT count FROM clears').fetchone()
+        if clears != self.__clears:
+            self.__clears = clears
+            self.__last_id = 0
+            self._notify_cleared()
+            # Buffered messages are still to be inserted
+            for message in self._pending():
+                self._notify_logged(message)
+        rows = self.__connection.execute(
+            'SELECT id, message FROM logs WHERE id > ? ORDER BY id', (self.__last_id,)
+        ).fetchall()
+        if rows:
+            self.__last_id = rows[-1][0]
+        # A buffered message another process inserted meanwhile is already known to listeners
+        messages = [message for _, message in rows if not self._drop_pending(message)]
+        for message in messages:
+            self._notify_logged(message)
+        return messages
+
+    def _write(self) -> None:
+        """Inserts buffered messages into the database in a single transaction."""
+
+        with self.__transaction():
+            # Messages other processes inserted come before the buffered ones in the database
+            self.__sync()
+            self.__connection.executemany(
+                'INSERT OR IGNORE INTO logs (message, service, secret, iteration, min_length, options) VALUES (?, ?, ?, ?, ?, ?)',
+                [(message, *split_message(message)) for message in self._pending()]
+            )
+            self.__last_id, = self.__connection.execute('SELECT COALESCE(MAX(id), 0) FROM logs').fetchone()
+
+    def __transaction(self, immediate: bool = True) -> sqlite3.Connection:
+        """
+        Wraps statements in a transaction.
+        :param immediate: Whether to take the write lock right away, otherwise the transaction only reads
+        """
+
+        self.__connection.execute('BEGIN IMMEDIATE' if immediate else 'BEGIN')
+        return self.__connection
+
+def migrate(text_filename: str, database_filename: str) -> int:
+    """
+    Copies the logs of a text log file into a log database, skipping duplicates.
+    :param text_filename: The text log file to read
+    :param database_filename: The database to write to
+    :return: The number of logs in the database afterwards
+    """
+
+    policy = FlushPolicy(max_count=MIGRATION_BATCH_SIZE)
+    with Logger(text_filename, lazy=True) as source, SQLiteLogger(database_filename, policy) as target:
+        for message in source:
+            target.log(message)
+        return len(target)
@@ -0,0 +1,172 @@
+"""
+File: stats.py
+Description: Collects opt-in timing and counter statistics
+"""
+
+from functools import wraps
+from _thread import allocate_lock
+from time import perf_counter
+from collections.abc import Callable
+
+# Bucket i of a histogram counts durations below 2 ** i microseconds
+BUCKETS = 32
+PERCENTILES = (50, 95, 99)
+# The code flag of coroutine functions, as inspect.CO_COROUTINE, without importing inspect at startup
+CO_COROUTINE = 0x80
+
+class Stats(object):
+    """Holds the counters, latency histograms and hooks of the process."""
+
+    enabled = False
+    counters = {}
+    timings = {}
+    hooks = []
+    lock = allocate_lock()
+
+    @staticmethod
+    def enable() -> None:
+        """Starts collecting statistics."""
+
+        Stats.enabled = True
+
+    @staticmethod
+    def disable() -> None:
+        """Stops collecting statistics, keeping those collected so far."""
+
+        Stats.enabled = False
+
+    @staticmethod
+    def reset() -> None:
+        """Discards all collected statistics."""
+
+        with Stats.lock:
+            Stats.counters.clear()
+            Stats.timings.clear()
+
+    @staticmethod
+    def subscribe(hook: Callable[[str, float | None, int], None]) -> None:
+        """
+        Passes every recorded event to a hook, such as an external profiler or exporter.
+        :param hook: Called with the event name, the duration in seconds (None for counters) and the count
+        """
+
+        Stats.hooks.append(hook)
+
+    @staticmethod
+    def increment(name: str, amount: int = 1) -> None:
+        """Adds to a counter if statistics are enabled."""
+
+        if not Stats.enabled:
+            return
+        with Stats.lock:
+            Stats.counters[name] = Stats.counters.get(name, 0) + amount
+        for hook in Stats.hooks:
+            hook(name, None, amount)
+
+    @staticmethod
+    def record(name: str, seconds: float) -> None:
+        """Adds a duration to a latency histogram if statistics are enabled."""
+
+        if not Stats.enabled:
+            return
+        bucket = min(int(seconds * 1e6).bit_length(), BUCKETS - 1)
+        with Stats.lock:
+            if (timing := Stats.timings.get(name)) is None:
+                timing = Stats.timings[name] = {'count': 0, 'total': 0.0, 'min': seconds, 'max': seconds, 'buckets': [0] * BUCKETS}
+            timing['count'] += 1
+            timing['total'] += seconds
+            timing['min'] = min(timing['min'], seconds)
+            timing['max'] = max(timing['max'], seconds)
+            timing['buckets'][bucket] += 1
+        for hook in Stats.hooks:
+            hook(name, seconds, 1)
+
+    @staticmethod
+    def snapshot() -> dict:
+        """
+        Summarizes the collected statistics.
+        :return: The counters, and per timing its count, total, mean, extremes and approximate percentiles in seconds
+        """
+
+        with Stats.lock:
+            timings = {}
+            for name, timing in sorted(Stats.timings.items()):
+                summary = {key: timing[key] for key in ('count', 'total', 'min', 'max')}
+                summary['mean'] = timing['total'] / timing['count']
+                for percentile in PERCENTILES:
+                    summary[f'p{percentile}'] = Stats.__percentile(timing, percentile)
+                timings[name] = summary
+            return {'counters': dict(sorted(Stats.counters.items())), 'timings': timings}
+
+    @staticmethod
+    def report(format: str = 'text') -> str:
+        """
+        Formats the collected statistics.
+        :param format: Either 'text' or 'json'
+        :return: The formatted statistics
+        """
+
+        snapshot = Stats.snapshot()
+        if format == 'json':
+            import json
+            return json.dumps(snapshot, indent=2)
+        lines = [f'{"timing":<28}{"count":>8}{"mean":>12}{"p50":>12}{"p95":>12}{"p99":>12}{"max":>12}']
+        for name, timing in snapshot['timings'].items():
+            columns = ''.join(f'{timing[key] * 1e6:>10.1f}us' for key in ('mean', 'p50', 'p95', 'p99', 'max'))
+            lines.append(f'{name:<28}{timing["count"]:>8}{columns}')
+        for name, count in snapshot['counters'].items():
+            lines.append(f'{name:<28}{count:>8}')
+        return '\n'.join(lines)
+
+    @staticmethod
+    def __percentile(timing: dict, percentile: int) -> float:
+        """Approximates a percentile by the upper bound of the bucket containing it, capped by the maximum."""
+
+        rank = timing['count'] * percentile / 100
+        seen = 0
+        for bucket, count in enumerate(timing['buckets']):
+            seen += count
+            if seen >= rank:
+                return min((1 << bucket) / 1e6, timing['max'])
+        return timing['max']
+
+def timed(name: str) -> Callable:
+    """
+    Records the latency of every call to the decorated function while statistics are enabled. The
+    latency of a coroutine function runs until its coroutine finishes, rather than until it is created.
+    :param name: The name of the timing
+    """
+
+    def decorator(function: Callable) -> Callable:
+        """Wraps a function with timing."""
+
+        if getattr(function, '__code__', None) is not None and function.__code__.co_flags & CO_COROUTINE:
+            @wraps(function)
+            async def coroutine_wrapper(*args: tuple, **kwargs: dict) -> object:
+                """Times the awaited call when enabled, otherwise awaits straight through."""
+
+                if not Stats.enabled:
+                    return await function(*args, **kwargs)
+                start = perf_counter()
+                try:
+                    return await function(*args, **kwargs)
+                finally:
+                    Stats.record(name, perf_counter() - start)
+
+            return coroutine_wrapper
+
+        @wraps(function)
+        def wrapper(*args: tuple, **kwargs: dict) -> object:
+            """Times the call when enabled, otherwise calls straight through."""
+
+            if not Stats.enabled:
+                return function(*args, **kwargs)
+            start = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                Stats.record(name, perf_counter() - start)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,60 @@
+"""
+File: test_audit.py
+Description: Tests the composition pre-filter of the audit and the input it finds
+"""
+
+from itertools import product
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from password_generator import MAX_MIN_LENGTH, generate, args_to_string
+from audit import audit_logs, audit_specs, composition, expected_composition
+
+OPTIONS = [options for options in product((False, True), repeat=4) if any(options)]
+INPUT = [
+    (f'service-{i}', 'secret', str(i % 3), min_length, *options, False)
+    for i, (min_length, options) in enumerate(product((1, 5, 12, 31, MAX_MIN_LENGTH + 20), OPTIONS))
+]
+MESSAGES = [args_to_string(*args) for args in INPUT]
+
+def test_expected_composition_matches_generated_passwords() -> None:
+    """Every generated password has the composition predicted from its minimum length and options."""
+
+    for args in INPUT:
+        assert composition(generate(*args)) == expected_composition(*args[3:8])
+
+def test_composition_counts_other_characters() -> None:
+    """Characters outside every type are counted separately, so no generated password has them."""
+
+    assert composition('aB3!é ') == (1, 1, 1, 1, 2)
+
+def test_pre_filter_skips_entries_of_other_compositions() -> None:
+    """Only the entries whose passwords can have a candidate's composition are regenerated."""
+
+    password = generate(*INPUT[7])
+    specs = list(audit_specs(MESSAGES, {composition(password)}))
+    assert (8, INPUT[7]) in specs
+    assert len(specs) < len(INPUT)
+    assert all(expected_composition(*args[3:8]) == composition(password) for _, args in specs)
+    assert list(audit_specs(MESSAGES, {composition('not generated')})) == []
+
+def test_pre_filter_tries_every_iteration_and_reading() -> None:
+    """Entries are tried with their logged iteration and the requested ones, in every reading of their input."""
+
+    specs = list(audit_specs(['some service secret 1 8 -ul', 'malformed'], {(4, 4, 0, 0, 0)}, range(3)))
+    iterations = {args[2] for _, args in specs}
+    readings = {args[:2] for _, args in specs}
+    assert iterations == {'0', '1', '2'} and readings == {('some', 'service secret'), ('some service', 'secret')}
+    assert len(specs) == 6 and {entry for entry, _ in specs} == {1}
+
+def test_audit_finds_the_input_of_candidates() -> None:
+    """The audit reports the entry and input that generated each candidate, including a different iteration."""
+
+    found = generate(*INPUT[20])
+    rotated = generate(INPUT[3][0], INPUT[3][1], '7', *INPUT[3][3:])
+    matches = list(audit_logs(MESSAGES, [found, rotated, 'missing'], range(5, 10), find_all=True))
+    assert (21, INPUT[20], found) in matches
+    assert (4, (*INPUT[3][:2], '7', *INPUT[3][3:]), rotated) in matches
+    assert {password for _, _, password in matches} == {found, rotated}
@@ -0,0 +1,99 @@
+"""
+File: test_kdf.py
+Description: Tests the bounded cache of derived master keys and the seeds derived from it
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import kdf
+from kdf import KeyDerivation, MasterKeyCache
+
+class Deriver(object):
+    """Derives stand-in master keys, recording every key it derived."""
+
+    __slots__ = 'keys',
+
+    def __init__(self) -> None:
+        """Starts without keys."""
+
+        self.keys = []
+
+    def __call__(self, secret: str) -> bytearray:
+        """Derives a key from a secret."""
+
+        self.keys.append(key := bytearray(f'key of {secret}'.encode('UTF-8')))
+        return key
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> list:
+    """A clock the cache reads, advanced by changing its only element."""
+
+    now = [0.0]
+    monkeypatch.setattr(kdf, 'monotonic', lambda: now[0])
+    return now
+
+def use(cache: MasterKeyCache, secret: str, derive: Deriver) -> bytes:
+    """Retrieves a copy of the master key of a secret through the cache."""
+
+    return cache.use(secret, derive, bytes)
+
+def test_hits_reuse_the_derived_key(clock: list) -> None:
+    """A cached key is handed to the action without being derived again."""
+
+    cache, derive = MasterKeyCache(), Deriver()
+    assert use(cache, 'a', derive) == use(cache, 'a', derive) == b'key of a'
+    assert len(derive.keys) == 1 and len(cache) == 1
+
+def test_eviction_drops_the_least_recently_used_key(clock: list) -> None:
+    """Once the cache is full, the key used least recently is zeroized and evicted."""
+
+    cache, derive = MasterKeyCache(max_size=2), Deriver()
+    for secret in ('a', 'b', 'a', 'c'):
+        use(cache, secret, derive)
+    key_a, key_b, key_c = derive.keys
+    assert key_b == bytes(len(key_b))
+    assert key_a == bytearray(b'key of a') and key_c == bytearray(b'key of c')
+    assert len(cache) == 2
+    assert use(cache, 'b', derive) == b'key of b'
+    assert len(derive.keys) == 4
+    assert key_a == bytes(len(key_a))
+
+def test_expired_keys_are_zeroized(clock: list) -> None:
+    """A key is zeroized and derived again once it outlives the TTL, however often it is used."""
+
+    cache, derive = MasterKeyCache(ttl=10.0), Deriver()
+    use(cache, 'a', derive)
+    clock[0] = 9.0
+    use(cache, 'a', derive)
+    assert len(derive.keys) == 1
+    clock[0] = 10.0
+    assert use(cache, 'a', derive) == b'key of a'
+    expired, renewed = derive.keys
+    assert expired == bytes(len(expired)) and renewed == bytearray(b'key of a')
+    assert len(cache) == 1
+
+def test_clear_zeroizes_every_key(clock: list) -> None:
+    """Clearing the cache zeroizes and forgets every key."""
+
+    cache, derive = MasterKeyCache(), Deriver()
+    for secret in ('a', 'b'):
+        use(cache, secret, derive)
+    cache.clear()
+    assert len(cache) == 0
+    assert all(key == bytes(len(key)) for key in derive.keys)
+
+def test_seeds_do_not_depend_on_the_cache() -> None:
+    """Seeds are the same whether the master key was cached, evicted or derived by another instance."""
+
+    derivation = KeyDerivation('pbkdf2', MasterKeyCache(max_size=1))
+    seed = derivation.seed('service', 'secret', 1)
+    derivation.seed('service', 'other secret', 1)
+    assert derivation.seed('service', 'secret', 1) == seed
+    assert KeyDerivation('pbkdf2').seed('service', 'secret', 1) == seed
+    assert derivation.seed('service', 'secret', 2) != seed
+    assert derivation.seed('other service', 'secret', 1) != seed
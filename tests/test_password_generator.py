@@ -0,0 +1,94 @@
+"""
+File: test_password_generator.py
+Description: Tests the generation APIs against the passwords the CLI and GUI generate
+"""
+
+from itertools import product
+from random import Random
+import random
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from password_generator import PasswordGenerator, generate
+
+CLASSES = (PasswordGenerator.UPPER, PasswordGenerator.LOWER, PasswordGenerator.DIGIT, PasswordGenerator.SPECIAL)
+OPTIONS = [options for options in product((False, True), repeat=4) if any(options)]
+SPECS = [
+    (f'service-{i}', f'secret {i}', i % 5, min_length, options)
+    for i, (min_length, options) in enumerate(product((1, 7, 12, 33), OPTIONS))
+]
+
+def test_generate_many_matches_generate() -> None:
+    """Generating a batch gives each spec the password generate() gives it, whatever the order of the batch."""
+
+    expected = [
+        generate(service, secret, iteration, min_length, *options)
+        for service, secret, iteration, min_length, options in SPECS
+    ]
+    assert list(PasswordGenerator.generate_many(SPECS)) == expected
+    assert list(PasswordGenerator.generate_many(SPECS[::-1])) == expected[::-1]
+
+def test_generate_many_leaves_global_state_alone() -> None:
+    """Generating a batch neither depends on nor changes the state seed() sets."""
+
+    PasswordGenerator.seed('before')
+    state = random.getstate()
+    passwords = list(PasswordGenerator.generate_many(SPECS[:5]))
+    assert random.getstate() == state
+    PasswordGenerator.seed('other')
+    assert list(PasswordGenerator.generate_many(SPECS[:5])) == passwords
+
+def seeded(spec: tuple) -> Random:
+    """Creates the generator generate() draws the password of a spec from."""
+
+    service, secret, iteration, _, _ = spec
+    return PasswordGenerator.seeded(PasswordGenerator.composite_seed(service, secret, iteration))
+
+def test_generate_into_matches_generate() -> None:
+    """Generating into a buffer writes the password generate() returns, leaving the rest of the buffer alone."""
+
+    for spec in SPECS:
+        _, _, _, min_length, options = spec
+        buffer = bytearray(b'\xff' * 40)
+        length = PasswordGenerator.generate_into(buffer, min_length, *options, rng=seeded(spec))
+        assert length == PasswordGenerator.length(min_length, *options)
+        assert buffer[:length].decode('ascii') == generate(*spec[:4], *options)
+        assert buffer[length:] == b'\xff' * (40 - length)
+        assert PasswordGenerator.generate_bytes(min_length, *options, rng=seeded(spec)) == buffer[:length]
+
+def test_generate_into_rejects_unusable_buffers() -> None:
+    """Buffers that are read-only or too short for the password are rejected."""
+
+    with pytest.raises(TypeError):
+        PasswordGenerator.generate_into(bytes(12), 12)
+    with pytest.raises(ValueError):
+        PasswordGenerator.generate_into(bytearray(11), 12)
+
+def test_exact_length() -> None:
+    """Exact passwords are min_length long, spreading the remainder over the first character types selected."""
+
+    for spec in SPECS:
+        _, _, _, min_length, options = spec
+        if min_length < sum(options):
+            with pytest.raises(ValueError):
+                PasswordGenerator.generate_bytes(min_length, *options, exact=True)
+            continue
+        password = PasswordGenerator.generate_bytes(min_length, *options, rng=seeded(spec), exact=True).decode('ascii')
+        assert len(password) == min_length
+        types = [characters for characters, include in zip(CLASSES, options) if include]
+        counts = [sum(character in characters for character in password) for characters in types]
+        assert counts == [min_length // len(types) + (i < min_length % len(types)) for i in range(len(types))]
+        if min_length % len(types) == 0:
+            # Without a remainder, an exact password is the one generate() returns
+            assert password == generate(*spec[:4], *options)
+
+def test_wipe() -> None:
+    """Wiping overwrites a generated password with zeros."""
+
+    password = PasswordGenerator.generate_bytes(12)
+    PasswordGenerator.wipe(password)
+    assert password == bytes(12)
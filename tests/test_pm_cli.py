@@ -0,0 +1,87 @@
+"""
+File: test_pm_cli.py
+Description: Tests the validation of batch specs and the parsing of command line arguments
+"""
+
+from io import StringIO
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logger import Logger
+from password_generator import generate
+from pm_cli import parse_args, process_batch, read_specs, record_to_args
+
+SPEC = {'service': 'service', 'secret': 'secret phrase', 'iteration': 1, 'min_length': 12, 'upper': True}
+ARGS = ('service', 'secret phrase', 1, 12, True, False, False, False, False)
+
+@pytest.mark.parametrize('changes', [
+    {},
+    {'iteration': 1.0, 'min_length': 12.0},
+    {'iteration': ' 1 ', 'min_length': '12'},
+    {'upper': 'True', 'lower': '', 'digit': '0', 'special': 'false', 'kdf': None},
+    {'upper': 1, 'lower': 0},
+])
+def test_valid_specs(changes: dict) -> None:
+    """Integers and options are read from JSON values and from CSV text alike."""
+
+    assert record_to_args({**SPEC, **changes}) == ARGS
+
+@pytest.mark.parametrize('record', [
+    ['service', 'secret', 1, 12],
+    {field: value for field, value in SPEC.items() if field != 'secret'},
+    {**SPEC, 'min_length': None},
+    {**SPEC, 'iteration': True},
+    {**SPEC, 'iteration': 1.5},
+    {**SPEC, 'min_length': float('inf')},
+    {**SPEC, 'min_length': '12.0'},
+    {**SPEC, 'iteration': [1]},
+    {**SPEC, 'upper': 'yes'},
+])
+def test_invalid_specs(record: object) -> None:
+    """Specs missing fields, or holding values that are not integers or options, are rejected."""
+
+    with pytest.raises(ValueError):
+        record_to_args(record)
+
+def test_batch_reports_errors_and_continues(tmp_path: 'Path') -> None:
+    """Each invalid line of a batch gets an error, while the valid lines are generated and logged once."""
+
+    lines = ['{"service": "a", "secret": "b", "iteration": 1, "min_length": 8, "digit": true}', 'not json',
+             '', '{"service": "a", "secret": "b", "iteration": true, "min_length": 8}',
+             '{"service": "a", "secret": "b", "iteration": 1, "min_length": 8, "digit": 1}']
+    with Logger(str(tmp_path / 'log')) as logger:
+        results = list(process_batch(read_specs(StringIO('\n'.join(lines)), 'jsonl'), logger))
+        assert logger.get_logs() == ['a b 1 8 -d']
+    password = generate('a', 'b', 1, 8, False, False, True, False)
+    assert [result['line'] for result in results] == [1, 2, 4, 5]
+    assert results[0] == {'line': 1, 'password': password}
+    assert results[3] == {'line': 5, 'password': password}
+    assert 'error' in results[1] and 'error' in results[2]
+
+@pytest.mark.parametrize('argv', [
+    ['service', 'secret', '1', '12', '-ul'],
+    ['-u', 'service', 'secret', '1', '12', '-l'],
+    ['service', '-u', 'secret', '1', '12', '--lower'],
+    ['service', 'secret', '-lu', '1', '12'],
+])
+def test_options_between_positional_arguments(argv: list) -> None:
+    """Options may come before, after or between the positional arguments."""
+
+    parsed = parse_args(argv)
+    assert (parsed.service, parsed.secret, parsed.iteration, parsed.min_length) == ('service', 'secret', 1, 12)
+    assert parsed.upper and parsed.lower and not parsed.digit
+
+@pytest.mark.parametrize('argv', [
+    ['service', 'secret', '1'],
+    ['--find', 'se', 'service', 'secret', '1', '12'],
+    ['--batch', 'specs.jsonl', '--find', 'se'],
+])
+def test_invalid_arguments(argv: list) -> None:
+    """Missing positional arguments, and positional arguments combined with a batch or search, are rejected."""
+
+    with pytest.raises(SystemExit):
+        parse_args(argv)
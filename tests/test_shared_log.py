@@ -0,0 +1,254 @@
+"""
+File: test_shared_log.py
+Description: Tests logs shared by several processes and the compaction of segmented logs
+"""
+
+from multiprocessing import Pool
+from random import Random
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logger import Logger, FlushPolicy, open_logger
+from segmented_logger import SegmentedLogger
+
+PROCESSES = 4
+MESSAGES = [f'service-{i} secret {i % 3} 12 -ulds' for i in range(100)]
+# Each text log mode keeps a different index, or none, to check duplicates against
+TEXT_MODES = {
+    'eager': {},
+    'lean': {'lean': True},
+    'lazy': {'lazy': True},
+    'lean-lazy': {'lean': True, 'lazy': True},
+}
+SEGMENTED_OPTIONS = {'max_entries': 7, 'max_segments': 3}
+
+class Listener(object):
+    """Records the changes a log notifies it of."""
+
+    __slots__ = 'events',
+
+    def __init__(self) -> None:
+        """Starts with no changes."""
+
+        self.events = []
+
+    def logged(self, message: str) -> None:
+        """Records a logged message."""
+
+        self.events.append(message)
+
+    def cleared(self) -> None:
+        """Records a clear."""
+
+        self.events.append(None)
+
+def open_log(path: str, mode: str, policy: FlushPolicy = None) -> Logger | SegmentedLogger:
+    """Opens a text log in one of TEXT_MODES, or a small-segmented log."""
+
+    if mode == 'segmented':
+        return SegmentedLogger(path, **SEGMENTED_OPTIONS, policy=policy)
+    return open_logger(path, 'text', **TEXT_MODES[mode], policy=policy)
+
+def log_all(path: str, mode: str, seed: int) -> int:
+    """
+    Logs every message that is not logged yet in a shuffled order, inside a worker process.
+    :return: The number of messages this process logged
+    """
+
+    messages = MESSAGES[:]
+    Random(seed).shuffle(messages)
+    with open_log(path, mode) as log:
+        return sum(log.log_if_not_exists(message) for message in messages)
+
+def log_if_not_exists(path: str, mode: str, message: str) -> bool:
+    """Logs a message if it is not logged yet, inside a worker process."""
+
+    with open_log(path, mode) as log:
+        return log.log_if_not_exists(message)
+
+def clear_and_log(path: str, mode: str, message: str) -> None:
+    """Clears the log and logs a message, inside a worker process."""
+
+    with open_log(path, mode) as log:
+        log.clear()
+        log.log(message)
+
+def run_in_process(function: callable, *args: tuple) -> object:
+    """Runs a function in a separate process and returns its result."""
+
+    with Pool(1) as pool:
+        return pool.apply(function, args)
+
+@pytest.fixture(params=[*TEXT_MODES, 'segmented'])
+def mode(request: pytest.FixtureRequest) -> str:
+    """Each text log mode and the segmented log."""
+
+    return request.param
+
+@pytest.fixture
+def path(tmp_path: 'Path', mode: str) -> str:
+    """The path of a new log in a temporary directory."""
+
+    return str(tmp_path / ('log.d' if mode == 'segmented' else 'log'))
+
+def test_concurrent_log_if_not_exists(path: str, mode: str) -> None:
+    """Processes logging the same messages at once log each message exactly once."""
+
+    # Part of the messages is logged up front, so the lookups also cover what was read at startup
+    with open_log(path, mode) as log:
+        for message in MESSAGES[::4]:
+            log.log(message)
+    with Pool(PROCESSES) as pool:
+        logged = pool.starmap(log_all, [(path, mode, seed) for seed in range(PROCESSES)])
+    assert sum(logged) == len(MESSAGES) - len(MESSAGES[::4])
+    with open_log(path, mode) as log:
+        assert sorted(log) == sorted(MESSAGES)
+
+def replay(events: list) -> list:
+    """Rebuilds the contents of a log from the changes a listener was notified of."""
+
+    messages = []
+    for event in events:
+        if event is None:
+            messages.clear()
+        else:
+            messages.append(event)
+    return messages
+
+def test_refresh_picks_up_other_processes(path: str, mode: str) -> None:
+    """A log picks up the messages other processes appended, and never logs them twice."""
+
+    with open_log(path, mode) as log:
+        listener = Listener()
+        log.subscribe(listener)
+        log.log(MESSAGES[0])
+        run_in_process(log_all, path, mode, 0)
+        picked_up = log.refresh()
+        if mode == 'segmented':
+            # The other process compacted the segment this log was appending to, so the log is read again
+            assert listener.events[1] is None and sorted(picked_up) == sorted(MESSAGES)
+        else:
+            assert sorted(picked_up) == sorted(MESSAGES[1:])
+        assert replay(listener.events) == list(log)
+        assert not any(log.log_if_not_exists(message) for message in MESSAGES)
+        assert len(log) == len(MESSAGES)
+
+def test_clear_from_another_process(path: str, mode: str) -> None:
+    """A log cleared by another process forgets the earlier messages and keeps the later ones."""
+
+    with open_log(path, mode) as log:
+        listener = Listener()
+        log.subscribe(listener)
+        for message in MESSAGES[:10]:
+            log.log_if_not_exists(message)
+        # Partly iterating a lazy log indexes part of the file before it is replaced
+        iterator = iter(log)
+        next(iterator)
+        run_in_process(clear_and_log, path, mode, MESSAGES[50])
+        assert log.refresh() == [MESSAGES[50]]
+        assert listener.events[-2:] == [None, MESSAGES[50]]
+        assert list(log) == [MESSAGES[50]]
+        assert not log.log_if_not_exists(MESSAGES[50])
+        assert log.log_if_not_exists(MESSAGES[0])
+    with open_log(path, mode) as log:
+        assert list(log) == [MESSAGES[50], MESSAGES[0]]
+
+def test_buffered_messages_survive_clear_from_another_process(tmp_path: 'Path') -> None:
+    """Messages buffered when another process clears the log are written to the new file."""
+
+    path = str(tmp_path / 'log')
+    with Logger(path, policy=FlushPolicy(max_count=None)) as log:
+        log.log(MESSAGES[0])
+        run_in_process(clear_and_log, path, 'eager', MESSAGES[1])
+        log.log(MESSAGES[2])
+    with Logger(path) as log:
+        assert log.get_logs() == [MESSAGES[1], MESSAGES[0], MESSAGES[2]]
+
+def test_buffered_messages_logged_by_another_process(path: str, mode: str) -> None:
+    """Buffered messages another process logs before they are flushed are written and notified once."""
+
+    with open_log(path, mode, FlushPolicy(max_count=None)) as log:
+        listener = Listener()
+        log.subscribe(listener)
+        # The other process's message is picked up by the flush itself
+        assert log.log_if_not_exists(MESSAGES[0])
+        assert run_in_process(log_if_not_exists, path, mode, MESSAGES[0])
+        log.flush()
+        # The other process's message is picked up before the flush
+        assert log.log_if_not_exists(MESSAGES[1])
+        assert run_in_process(log_if_not_exists, path, mode, MESSAGES[1])
+        assert log.refresh() == []
+        log.flush()
+        assert listener.events == MESSAGES[:2]
+        assert list(log) == MESSAGES[:2]
+    with open_log(path, mode) as log:
+        assert list(log) == MESSAGES[:2]
+
+def test_compaction_drops_duplicates(tmp_path: 'Path') -> None:
+    """Compaction keeps the first occurrence of each message in order, across processes."""
+
+    path = str(tmp_path / 'log.d')
+    messages = [MESSAGES[i % 20] for i in range(60)]
+    with SegmentedLogger(path, max_entries=7, max_segments=None) as log:
+        for message in messages:
+            log.log(message)
+        dropped = log.compact()
+        # The active segment is not compacted, so its messages may repeat sealed ones
+        active = messages[len(messages) // 7 * 7:]
+        sealed = messages[:len(messages) - len(active)]
+        assert dropped == len(sealed) - len(set(sealed))
+        assert list(log) == list(dict.fromkeys(sealed)) + active
+        assert len(log) == len(set(sealed)) + len(active)
+        assert log.compact() == 0
+    with SegmentedLogger(path, max_entries=7, max_segments=None) as log:
+        assert list(log) == list(dict.fromkeys(sealed)) + active
+        assert not any(log.log_if_not_exists(message) for message in messages)
+
+def test_automatic_compaction_bounds_segments(tmp_path: 'Path') -> None:
+    """Rotation compacts once there are too many sealed segments, without losing messages."""
+
+    path = str(tmp_path / 'log.d')
+    with SegmentedLogger(path, **SEGMENTED_OPTIONS) as log:
+        for message in MESSAGES:
+            log.log_if_not_exists(message)
+        assert list(log) == MESSAGES
+    segments = [name for name in os.listdir(path) if name.endswith('.log')]
+    assert len(segments) <= SEGMENTED_OPTIONS['max_segments'] + 1
+
+def compact(path: str) -> int:
+    """Compacts a segmented log, inside a worker process."""
+
+    with SegmentedLogger(path, max_entries=7, max_segments=None) as log:
+        return log.compact()
+
+def test_iteration_survives_compaction(tmp_path: 'Path') -> None:
+    """Iterating a log yields the messages it held when iteration started, even if another process compacts it."""
+
+    path = str(tmp_path / 'log.d')
+    messages = [MESSAGES[i % 20] for i in range(60)]
+    with SegmentedLogger(path, max_entries=7, max_segments=None) as log:
+        for message in messages:
+            log.log(message)
+        iterator = iter(log)
+        read = [next(iterator) for _ in range(3)]
+        assert run_in_process(compact, path) > 0
+        assert read + list(iterator) == messages
+
+def test_compaction_while_another_process_logs(tmp_path: 'Path') -> None:
+    """A log compacted by another process still lists every message once."""
+
+    path = str(tmp_path / 'log.d')
+    with SegmentedLogger(path, max_entries=7, max_segments=None) as log:
+        for message in MESSAGES[:50]:
+            log.log_if_not_exists(message)
+        with Pool(PROCESSES) as pool:
+            pending = pool.starmap_async(log_all, [(path, 'segmented', seed) for seed in range(PROCESSES)])
+            log.compact()
+            pending.get()
+        log.refresh()
+        assert sorted(log) == sorted(MESSAGES)
+        assert not any(log.log_if_not_exists(message) for message in MESSAGES)
@@ -0,0 +1,44 @@
+"""
+File: vault_export.py
+Description: Regenerates the password of every logged input
+"""
+
+from password_generator import generate
+from bulk_generator import map_chunks
+from log_format import parse_log
+from collections.abc import Iterable, Iterator
+
+EXPORT_FIELDS = ('entry', 'service', 'secret', 'iteration', 'min_length', 'options', 'password', 'error')
+
+def export_chunk(entries: list) -> list:
+    """
+    Regenerates the passwords of a chunk of log entries, possibly inside a worker process.
+    :param entries: Tuples of (entry number, logged input)
+    :return: A record per entry holding its input and either its password or the reason it was skipped
+    """
+
+    records = []
+    for entry, message in entries:
+        try:
+            args = parse_log(message)
+            password = generate(*args)
+        except ValueError as e:
+            records.append({'entry': entry, 'error': str(e)})
+            continue
+        service, secret, iteration, min_length = args[:4]
+        options = message.rsplit(' ', 1)[1]
+        records.append({
+            'entry': entry, 'service': service, 'secret': secret, 'iteration': iteration,
+            'min_length': min_length, 'options': options, 'password': password
+        })
+    return records
+
+def export_logs(messages: Iterable[str], workers: int = 1) -> Iterator[dict]:
+    """
+    Lazily regenerates the password of each log entry, holding only a bounded number of entries at once.
+    :param messages: The logged input, in log order
+    :param workers: The number of worker processes to regenerate passwords in
+    :return: A record per entry, in log order, as produced by export_chunk()
+    """
+
+    return map_chunks(export_chunk, enumerate(messages, 1), workers)
@@ -0,0 +1,146 @@
+"""
+File: vectorized_generator.py
+Description: Generates passwords in bulk with NumPy
+"""
+
+from password_generator import PasswordGenerator
+from collections.abc import Iterable, Iterator
+from stats import timed
+
+try:
+    import numpy
+except ImportError:
+    # The vectorized scheme is optional, BulkGenerator falls back to the scalar scheme by default
+    numpy = None
+
+# Bump whenever the passwords generated for a spec change, since they cannot be reproduced otherwise
+SCHEME_VERSION = 1
+ALPHABET = (PasswordGenerator.UPPER + PasswordGenerator.LOWER + PasswordGenerator.DIGIT + PasswordGenerator.SPECIAL).encode('ascii')
+CLASS_SIZES = (
+    len(PasswordGenerator.UPPER), len(PasswordGenerator.LOWER), len(PasswordGenerator.DIGIT), len(PasswordGenerator.SPECIAL)
+)
+CLASS_OFFSETS = tuple(sum(CLASS_SIZES[:i]) for i in range(len(CLASS_SIZES)))
+
+class VectorizedGenerator(object):
+    """
+    Generates passwords for many specs at once with NumPy, using its own versioned scheme.
+
+    The passwords are NOT those of PasswordGenerator.generate() for the same spec: they have the same
+    length and character classes, and are seeded from the same SHA-256 digest of the composite seed,
+    but are drawn differently. Scheme 1 expands each digest into a 64-bit key and draws word j of a
+    password from the SplitMix64 finalizer of key + j * golden gamma. The high 32 bits of a word pick
+    its character within its class by multiply-shift, and the low 32 bits are sort keys that
+    permute the characters, with ties kept in order.
+    """
+
+    MASK = 0xFFFFFFFF
+    GAMMA = 0x9E3779B97F4A7C15
+
+    @staticmethod
+    def available() -> bool:
+        """Checks whether NumPy is installed."""
+
+        return numpy is not None
+
+    @staticmethod
+    @timed('generator.generate_vectorized')
+    def generate_many(specs: Iterable[tuple]) -> Iterator[str]:
+        """
+        Generates a password for each spec, drawing every spec of the same length and options together.
+        :param specs: Specs in the format accepted by PasswordGenerator.generate_many
+        :return: The generated passwords, in the order of the specs
+        """
+
+        if numpy is None:
+            raise ImportError('The vectorized generator requires NumPy')
+        groups = {}
+        count = 0
+        for service, secret, iteration, min_length, options in specs:
+            positions, digests = groups.setdefault((min_length, tuple(map(bool, options))), ([], []))
+            positions.append(count)
+            digests.append(PasswordGenerator.seed_digest(PasswordGenerator.composite_seed(service, secret, iteration)))
+            count += 1
+        passwords = [None] * count
+        for (min_length, options), (positions, digests) in groups.items():
+            for position, password in zip(positions, VectorizedGenerator.generate_group(digests, min_length, *options)):
+                passwords[position] = password
+        return iter(passwords)
+
+    @staticmethod
+    def generate_group(
+        digests: list,
+        min_length: int,
+        include_upper: bool = True,
+        include_lower: bool = True,
+        include_digit: bool = True,
+        include_special: bool = True
+    ) -> list:
+        """
+        Generates passwords of the same length and options.
+        :param digests: The seed digests of the passwords, as returned by PasswordGenerator.seed_digest
+        :param min_length: The minimum length of the passwords
+        :param include_upper: Whether to include uppercase letters
+        :param include_lower: Whether to include lowercase letters
+        :param include_digit: Whether to include digits
+        :param include_special: Whether to include special characters
+        :return: The generated passwords, in the order of the digests
+        """
+
+        codes = VectorizedGenerator.draw(digests, min_length, include_upper, include_lower, include_digit, include_special)
+        count, length = codes.shape
+        if not length:
+            return [''] * count
+        # Decoding the whole array at once is far cheaper than decoding row by row
+        text = codes.tobytes().decode('ascii')
+        return [text[start:start + length] for start in range(0, count * length, length)]
+
+    @staticmethod
+    def draw(
+        digests: list,
+        min_length: int,
+        include_upper: bool = True,
+        include_lower: bool = True,
+        include_digit: bool = True,
+        include_special: bool = True
+    ) -> 'numpy.ndarray':
+        """
+        Draws the characters of passwords of the same length and options.
+        :param digests: The seed digests of the passwords, as returned by PasswordGenerator.seed_digest
+        :param min_length: The minimum length of the passwords
+        :param include_upper: Whether to include uppercase letters
+        :param include_lower: Whether to include lowercase letters
+        :param include_digit: Whether to include digits
+        :param include_special: Whether to include special characters
+        :return: A uint8 array holding the ASCII codes of a password per row
+        """
+
+        if numpy is None:
+            raise ImportError('The vectorized generator requires NumPy')
+        included = (include_upper, include_lower, include_digit, include_special)
+        num_components = sum(included)
+        if num_components <= 0:
+            raise ValueError('Password must include at least one character type')
+        num_each = -(min_length // -num_components)
+        # Before shuffling, a password holds num_each characters of each included class in order
+        sizes = numpy.repeat([size for size, include in zip(CLASS_SIZES, included) if include], num_each).astype(numpy.uint64)
+        offsets = numpy.repeat([offset for offset, include in zip(CLASS_OFFSETS, included) if include], num_each)
+        keys = numpy.frombuffer(b''.join(digests), dtype='<u8').reshape(len(digests), 4)
+        key = numpy.zeros(len(digests), dtype=numpy.uint64)
+        for column in range(4):
+            key = VectorizedGenerator.__mix(key ^ keys[:, column])
+        counters = numpy.arange(1, len(sizes) + 1, dtype=numpy.uint64) * numpy.uint64(VectorizedGenerator.GAMMA)
+        words = VectorizedGenerator.__mix(key[:, None] + counters[None, :])
+        indices = ((words >> numpy.uint64(32)) * sizes >> numpy.uint64(32)).astype(numpy.intp) + offsets
+        order = numpy.argsort(words & numpy.uint64(VectorizedGenerator.MASK), axis=1, kind='stable')
+        alphabet = numpy.frombuffer(ALPHABET, dtype=numpy.uint8)
+        return alphabet[numpy.take_along_axis(indices, order, axis=1)]
+
+    @staticmethod
+    def __mix(words: 'numpy.ndarray') -> 'numpy.ndarray':
+        """Applies the SplitMix64 finalizer to every word, wrapping on overflow."""
+
+        words = words ^ (words >> numpy.uint64(30))
+        words = words * numpy.uint64(0xBF58476D1CE4E5B9)
+        words = words ^ (words >> numpy.uint64(27))
+        words = words * numpy.uint64(0x94D049BB133111EB)
+        return words ^ (words >> numpy.uint64(31))
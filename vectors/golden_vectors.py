@@ -0,0 +1,220 @@
+"""
+File: golden_vectors.py
+Description: Checks that password generation still reproduces a corpus of golden vectors
+"""
+
+from argparse import ArgumentParser, Namespace
+from collections.abc import Iterator
+from functools import partial
+from io import TextIOWrapper
+from itertools import islice
+from time import perf_counter
+from random import Random
+from os import cpu_count
+import gzip
+import sys
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from password_generator import PasswordGenerator, generate, options_to_string, MAX_MIN_LENGTH
+from vectorized_generator import VectorizedGenerator, SCHEME_VERSION as VECTORIZED_SCHEME_VERSION
+from bulk_generator import map_chunks
+
+# The scalar scheme is what the CLI and GUI generate, the vectorized one what BulkGenerator generates with NumPy
+SCHEMES = {
+    'scalar': (PasswordGenerator.SCHEME_VERSION, 25_000),
+    'vectorized': (VECTORIZED_SCHEME_VERSION, 5_000),
+}
+COLUMNS = ('service', 'secret', 'iteration', 'min_length', 'options', 'password')
+CHUNK_SIZE = 2000
+# Inputs are drawn from a fixed seed, so regenerating under a new scheme keeps the same inputs
+INPUT_SEED = 'golden-vectors'
+CHARACTERS = PasswordGenerator.UPPER + PasswordGenerator.LOWER + PasswordGenerator.DIGIT + ' -_.@/:éßø密码ключ🔑'
+KDF_SECRETS = ('kdf-secret', '', 'ключ 🔑')
+KDF_SHARE = 0.01
+
+def corpus_path(scheme: str) -> str:
+    """Determines the corpus file of a scheme."""
+
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), f'{scheme}.tsv.gz')
+
+def random_string(rng: Random, max_length: int) -> str:
+    """Draws a string of up to a maximum length, empty ones included."""
+
+    return ''.join(rng.choices(CHARACTERS, k=rng.randint(0, max_length)))
+
+def inputs(scheme: str, count: int) -> Iterator[tuple]:
+    """
+    Draws the inputs of a corpus, covering every combination of options, empty strings, non-ASCII
+    text, minimum lengths beyond those the CLI allows and, for the scalar scheme, key derivation.
+    :param scheme: The scheme of the corpus
+    :param count: The number of inputs
+    :return: The input arguments, in the order accepted by password_generator.generate()
+    """
+
+    rng = Random(f'{INPUT_SEED}/{scheme}')
+    for _ in range(count):
+        options = [False] * 4
+        while not any(options):
+            options = [rng.random() < 0.5 for _ in range(4)]
+        kdf = scheme == 'scalar' and rng.random() < KDF_SHARE
+        # Mostly realistic lengths, with the occasional long or clamped one
+        min_length = rng.randint(0, 32) if rng.random() < 0.97 else rng.randint(41, MAX_MIN_LENGTH + 10)
+        secret = rng.choice(KDF_SECRETS) if kdf else random_string(rng, 16)
+        yield random_string(rng, 12), secret, rng.randint(0, 1000), min_length, *options, kdf
+
+def generate_chunk(scheme: str, chunk: list) -> list:
+    """
+    Generates the passwords of a chunk of inputs under a scheme, possibly inside a worker process.
+    :param scheme: The scheme to generate with
+    :param chunk: The input arguments, in the order accepted by password_generator.generate()
+    :return: The generated passwords, in the order of the inputs
+    """
+
+    if scheme == 'scalar':
+        return [generate(*args) for args in chunk]
+    specs = [(service, secret, iteration, min_length, options) for service, secret, iteration, min_length, *options, _ in chunk]
+    return list(VectorizedGenerator.generate_many(specs))
+
+def check_chunk(scheme: str, chunk: list) -> list:
+    """
+    Regenerates a chunk of vectors, possibly inside a worker process.
+    :param scheme: The scheme of the vectors
+    :param chunk: Tuples of (line number, input arguments, expected password)
+    :return: Tuples of (line number, input arguments, expected password, generated password) for each divergence
+    """
+
+    passwords = generate_chunk(scheme, [args for _, args, _ in chunk])
+    return [(line, args, expected, password) for (line, args, expected), password in zip(chunk, passwords) if password != expected]
+
+def read_header(path: str) -> tuple:
+    """
+    Reads the header of a corpus.
+    :param path: The corpus file
+    :return: The scheme, the scheme version and the number of vectors of the corpus
+    """
+
+    with gzip.open(path, 'rt', encoding='UTF-8', newline='\n') as file:
+        _, scheme, _, version, _, count = file.readline().rstrip('\n').split('\t')
+        if tuple(file.readline().rstrip('\n').split('\t')) != COLUMNS:
+            raise ValueError(f'{path} does not list the columns {", ".join(COLUMNS)}')
+    return scheme, int(version), int(count)
+
+def read_vectors(path: str, count: int) -> Iterator[tuple]:
+    """
+    Lazily reads the vectors of a corpus, raising ValueError once read if it was truncated.
+    :param path: The corpus file
+    :param count: The number of vectors the header lists
+    :return: Tuples of (line number, input arguments, expected password)
+    """
+
+    read = 0
+    with gzip.open(path, 'rt', encoding='UTF-8', newline='\n') as file:
+        for read, line in enumerate(islice(file, 2, None), 1):
+            service, secret, iteration, min_length, options, password = line.rstrip('\n').split('\t')
+            flags = [flag in options for flag in 'uldsk']
+            yield read + 2, (service, secret, int(iteration), int(min_length), *flags), password
+    if read != count:
+        raise ValueError(f'{path} holds {read} vectors, but its header lists {count}')
+
+def check(args: Namespace) -> None:
+    """Checks each corpus, exiting with an error at the first divergence."""
+
+    for scheme in args.schemes:
+        if scheme == 'vectorized' and not VectorizedGenerator.available():
+            print(f'{scheme:<12}skipped, NumPy is not installed')
+            continue
+        path = corpus_path(scheme)
+        corpus_scheme, version, count = read_header(path)
+        current_version = SCHEMES[scheme][0]
+        if (corpus_scheme, version) != (scheme, current_version):
+            sys.exit(f'{scheme}: the corpus holds {corpus_scheme} version {version}, but the code generates version {current_version}')
+        start = perf_counter()
+        vectors = read_vectors(path, count)
+        divergences = map_chunks(partial(check_chunk, scheme), vectors, args.workers, CHUNK_SIZE)
+        try:
+            for line, inputs, expected, password in divergences:
+                divergences.close()
+                service, secret, iteration, min_length, *options = inputs
+                sys.exit(
+                    f'{scheme} version {version} diverges at line {line} for '
+                    f'{service!r} {secret!r} {iteration} {min_length} {options_to_string(*options)}: '
+                    f'expected {expected!r}, generated {password!r}'
+                )
+        except (ValueError, EOFError) as e:
+            # A truncated or malformed corpus
+            sys.exit(f'{scheme}: {e}')
+        print(f'{scheme:<12}version {version}, {count} vectors match ({perf_counter() - start:.1f}s)')
+
+def regenerate(args: Namespace) -> None:
+    """Writes the corpus of a scheme under its new version."""
+
+    current_version, count = SCHEMES[args.scheme]
+    if args.version != current_version:
+        sys.exit(f'The code generates {args.scheme} version {current_version}, not {args.version}')
+    path = corpus_path(args.scheme)
+    if os.path.exists(path) and not args.force:
+        _, version, _ = read_header(path)
+        if args.version <= version:
+            sys.exit(f'{path} already holds version {version}, regenerating needs a newer version or --force')
+    if args.scheme == 'vectorized' and not VectorizedGenerator.available():
+        sys.exit(f'Regenerating the {args.scheme} corpus requires NumPy')
+    count = args.count or count
+    passwords = map_chunks(partial(generate_chunk, args.scheme), inputs(args.scheme, count), args.workers, CHUNK_SIZE)
+    temporary = f'{path}.tmp'
+    # A fixed timestamp and no file name keep the compressed corpus identical between regenerations
+    with open(temporary, 'wb') as raw, gzip.GzipFile(filename='', fileobj=raw, mode='wb', mtime=0) as compressed:
+        with TextIOWrapper(compressed, encoding='UTF-8', newline='\n') as file:
+            file.write(f'scheme\t{args.scheme}\tversion\t{args.version}\tcount\t{count}\n')
+            file.write('\t'.join(COLUMNS) + '\n')
+            for (service, secret, iteration, min_length, *options), password in zip(inputs(args.scheme, count), passwords):
+                fields = (service, secret, str(iteration), str(min_length), options_to_string(*options), password)
+                file.write('\t'.join(fields) + '\n')
+    os.replace(temporary, path)
+    print(f'{args.scheme:<12}version {args.version}, {count} vectors written to {path}')
+
+def parse_args() -> Namespace:
+    """Parses command line arguments."""
+
+    arg_parser = ArgumentParser(description='check password generation against the golden vectors')
+    subparsers = arg_parser.add_subparsers(dest='command', required=True)
+    check_parser = subparsers.add_parser('check', help='check that every vector is still reproduced')
+    check_parser.add_argument(
+        '--only',
+        dest='schemes',
+        nargs='+',
+        choices=tuple(SCHEMES),
+        default=tuple(SCHEMES),
+        help='the schemes to check'
+    )
+    check_parser.set_defaults(function=check)
+    regenerate_parser = subparsers.add_parser('regenerate', help='rewrite the corpus of a scheme after a deliberate change')
+    regenerate_parser.add_argument('scheme', choices=tuple(SCHEMES), help='the scheme to regenerate')
+    regenerate_parser.add_argument(
+        '--version',
+        type=int,
+        required=True,
+        help='the new scheme version, which must match the code and be newer than the corpus'
+    )
+    regenerate_parser.add_argument('--count', type=int, help='the number of vectors, the default of the scheme otherwise')
+    regenerate_parser.add_argument('--force', action='store_true', help='overwrite a corpus of the same or a newer version')
+    regenerate_parser.set_defaults(function=regenerate)
+    for subparser in (check_parser, regenerate_parser):
+        subparser.add_argument(
+            '-w', '--workers',
+            type=int,
+            default=cpu_count() or 1,
+            help='the number of processes generating passwords'
+        )
+    return arg_parser.parse_args()
+
+def main() -> None:
+    """Runs the golden vector program."""
+
+    args = parse_args()
+    args.function(args)
+
+if __name__ == '__main__':
+    main()